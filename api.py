@@ -0,0 +1,207 @@
+# api.py
+# Servicio HTTP/JSON sin Streamlit con los mismos cálculos que la aplicación: consulta de la
+# tabla oficial (pestaña 1), ruta con tope a 90 km/h (pestaña 2) y lotes de ambas. Comparte
+# tiempos.csv (con recarga en caliente) y la caché de rutas en SQLite con la aplicación.
+#
+# Uso:
+#   python api.py --port 8080                          # clave de Google en GOOGLE_API_KEY
+#   python api.py --token secreto --fixture rutas_grabadas.json
+#
+#   GET  /salud  /provincias  /poblaciones?provincia=...  [/metrics con DIGI_METRICAS=1]
+#   POST /tabla  {"provincia", "entrada", "salida"}
+#   POST /ruta   {"origen_ida", "destino_ida", "origen_vuelta", "destino_vuelta"}
+#   POST /lote   {"tabla": [...], "rutas": [...]}
+import argparse
+import asyncio
+import hmac
+import os
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, PlainTextResponse, Response
+from starlette.routing import Route
+
+import cache_rutas
+import metricas
+import motor_calculo
+import recarga
+import rutas
+import tabla_tiempos
+
+MAX_LOTE = 1000
+CAMPOS_TABLA = ('provincia', 'entrada', 'salida')
+CAMPOS_RUTA = ('origen_ida', 'destino_ida', 'origen_vuelta', 'destino_vuelta')
+
+
+class ErrorPeticion(ValueError):
+    def __init__(self, mensaje, estado=400):
+        super().__init__(mensaje)
+        self.estado = estado
+
+
+def _campos(consulta, campos):
+    if not isinstance(consulta, dict): raise ErrorPeticion("Cada consulta debe ser un objeto JSON.")
+    faltan = [c for c in campos if not isinstance(consulta.get(c), str) or not consulta[c].strip()]
+    if faltan: raise ErrorPeticion(f"Faltan los campos obligatorios: {faltan}")
+    return [consulta[c].strip() for c in campos]
+
+
+def _error(e):
+    return {'error': str(e), 'estado': e.estado}
+
+
+# --- CÁLCULOS ---
+def consultar_tabla(indice, consultas):
+    # Una respuesta por consulta, en el mismo orden; las válidas se evalúan en una sola llamada vectorizada.
+    respuestas, posiciones, idas, vueltas = [None] * len(consultas), [], [], []
+    for i, consulta in enumerate(consultas):
+        try:
+            provincia, entrada, salida = _campos(consulta, CAMPOS_TABLA)
+            ida, vuelta = indice.buscar(provincia, entrada), indice.buscar(provincia, salida)
+            if ida is None or vuelta is None:
+                raise ErrorPeticion(f"No hay datos en la tabla para '{entrada if ida is None else salida}' en la provincia '{provincia}'.", 404)
+        except ErrorPeticion as e:
+            respuestas[i] = _error(e); continue
+        posiciones.append(i); idas.append(ida); vueltas.append(vuelta)
+    if posiciones:
+        evaluacion = motor_calculo.evaluar_trayectos(
+            [r.distancia for r in idas], [r.minutos_total for r in idas], [r.distancia for r in vueltas], [r.minutos_total for r in vueltas],
+            [r.minutos_cargo for r in idas], [r.minutos_cargo for r in vueltas])
+        evaluacion['centro_trabajo_ida'] = [r.centro_trabajo for r in idas]
+        evaluacion['centro_trabajo_vuelta'] = [r.centro_trabajo for r in vueltas]
+        for i, registro in zip(posiciones, evaluacion.to_dict('records')): respuestas[i] = registro
+    return respuestas
+
+
+async def calcular_rutas(servicio, consultas):
+    if servicio.cliente is None: raise ErrorPeticion("La clave de API de Google no está disponible.", 503)
+
+    async def una(consulta):
+        try: origen_ida, destino_ida, origen_vuelta, destino_vuelta = _campos(consulta, CAMPOS_RUTA)
+        except ErrorPeticion as e: return e
+        identico = motor_calculo.es_trayecto_identico(origen_ida, destino_ida, origen_vuelta, destino_vuelta)
+        # Las Futures del resolutor agrupan rutas iguales en vuelo, también entre peticiones distintas.
+        ida = servicio.resolutor.resolver(origen_ida, destino_ida, servicio.cliente, servicio.cache)
+        vuelta = ida if identico else servicio.resolutor.resolver(origen_vuelta, destino_vuelta, servicio.cliente, servicio.cache)
+        resultado_ida = await asyncio.wrap_future(ida)
+        resultado_vuelta = resultado_ida if identico else await asyncio.wrap_future(vuelta)
+        return resultado_ida, resultado_vuelta, identico
+
+    resultados = await asyncio.gather(*(una(consulta) for consulta in consultas))
+    respuestas, posiciones, calculadas = [None] * len(consultas), [], []
+    for i, resultado in enumerate(resultados):
+        if isinstance(resultado, ErrorPeticion): respuestas[i] = _error(resultado); continue
+        (dist_ida, min_ida, err_ida), (dist_vuelta, min_vuelta, err_vuelta), identico = resultado
+        if err_ida or err_vuelta: respuestas[i] = {'error': err_ida or err_vuelta, 'estado': 502}; continue
+        posiciones.append(i); calculadas.append((dist_ida, min_ida, dist_vuelta, min_vuelta, identico))
+    if posiciones:
+        dist_ida, min_ida, dist_vuelta, min_vuelta, identico = zip(*calculadas)
+        evaluacion = motor_calculo.evaluar_trayectos(dist_ida, min_ida, dist_vuelta, min_vuelta, identico=list(identico))
+        for i, registro in zip(posiciones, evaluacion.to_dict('records')): respuestas[i] = registro
+    return respuestas
+
+
+# --- SERVICIO ---
+class Servicio:
+    def __init__(self, tiempos="tiempos.csv", cliente=None, cache=None, token=None, hilos_rutas=16):
+        self.tiempos = recarga.DatosVivos(tiempos, tabla_tiempos.cargar_tiempos, {'indice': tabla_tiempos.IndiceTiempos})
+        self.cliente, self.cache, self.token = cliente, cache, token
+        self.resolutor = rutas.ResolutorRutas(max_workers=hilos_rutas)
+
+    @property
+    def indice(self):
+        return self.tiempos.actual().derivados['indice']
+
+    def autorizado(self, request):
+        if not self.token: return True
+        return hmac.compare_digest(request.headers.get('authorization', ''), f"Bearer {self.token}")
+
+
+def crear_app(servicio):
+    def endpoint(etapa, manejador):
+        async def atender(request):
+            if not servicio.autorizado(request): return JSONResponse({'error': "No autorizado."}, 401)
+            with metricas.medir(etapa):
+                try:
+                    cuerpo = await request.json() if request.method == 'POST' else None
+                except ValueError:
+                    return JSONResponse({'error': "El cuerpo de la petición no es JSON válido."}, 400)
+                try: respuesta = await manejador(request, cuerpo)
+                except ErrorPeticion as e: return JSONResponse({'error': str(e)}, e.estado)
+            if isinstance(respuesta, Response): return respuesta
+            if isinstance(respuesta, dict) and 'error' in respuesta: return JSONResponse({'error': respuesta['error']}, respuesta['estado'])
+            return JSONResponse(respuesta)
+        return atender
+
+    async def salud(request, cuerpo):
+        error = servicio.tiempos.ultimo_error
+        return {'version_tiempos': servicio.tiempos.actual().version, 'error_recarga': None if error is None else str(error)}
+
+    async def provincias(request, cuerpo):
+        return servicio.indice.provincias
+
+    async def poblaciones(request, cuerpo):
+        provincia = request.query_params.get('provincia', '')
+        if provincia not in servicio.indice.provincias: raise ErrorPeticion(f"Provincia desconocida: '{provincia}'.", 404)
+        return servicio.indice.poblaciones_de(provincia)
+
+    async def tabla(request, cuerpo):
+        return consultar_tabla(servicio.indice, [cuerpo])[0]
+
+    async def ruta(request, cuerpo):
+        return (await calcular_rutas(servicio, [cuerpo]))[0]
+
+    async def lote(request, cuerpo):
+        if not isinstance(cuerpo, dict): raise ErrorPeticion("El lote debe ser un objeto JSON con las listas 'tabla' y/o 'rutas'.")
+        consultas_tabla, consultas_rutas = cuerpo.get('tabla') or [], cuerpo.get('rutas') or []
+        if not isinstance(consultas_tabla, list) or not isinstance(consultas_rutas, list): raise ErrorPeticion("'tabla' y 'rutas' deben ser listas.")
+        if len(consultas_tabla) + len(consultas_rutas) > MAX_LOTE: raise ErrorPeticion(f"Como máximo {MAX_LOTE} consultas por lote.", 413)
+        return {'tabla': consultar_tabla(servicio.indice, consultas_tabla),
+                'rutas': await calcular_rutas(servicio, consultas_rutas) if consultas_rutas else []}
+
+    async def metrics(request, cuerpo):
+        return PlainTextResponse(metricas.REGISTRO.prometheus(), media_type='text/plain; version=0.0.4')
+
+    rutas_http = [
+        Route('/salud', endpoint('api.salud', salud)),
+        Route('/provincias', endpoint('api.provincias', provincias)),
+        Route('/poblaciones', endpoint('api.poblaciones', poblaciones)),
+        Route('/tabla', endpoint('api.tabla', tabla), methods=['POST']),
+        Route('/ruta', endpoint('api.ruta', ruta), methods=['POST']),
+        Route('/lote', endpoint('api.lote', lote), methods=['POST']),
+    ]
+    # Con --token, /metrics exige el mismo token que el resto de la API.
+    if metricas.ACTIVAS: rutas_http.append(Route('/metrics', endpoint('api.metrics', metrics)))
+    return Starlette(routes=rutas_http)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="API HTTP/JSON de la calculadora de tiempos de desplazamiento.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--tiempos', default='tiempos.csv')
+    parser.add_argument('--api-key', default=os.environ.get('GOOGLE_API_KEY'))
+    parser.add_argument('--fixture', help="Fichero JSON de respuestas grabadas (recalcular_tabla.py --grabar); no se usa la red.")
+    parser.add_argument('--token', default=os.environ.get('DIGI_API_TOKEN'), help="Si se indica, se exige 'Authorization: Bearer <token>'.")
+    parser.add_argument('--cache-rutas', default='rutas_cache.sqlite', help="La misma caché que usa la aplicación ([route_cache] path).")
+    parser.add_argument('--ttl-horas', type=float, default=24 * 30)
+    parser.add_argument('--max-entradas', type=int, default=20000)
+    parser.add_argument('--hilos-rutas', type=int, default=16)
+    args = parser.parse_args(argv)
+
+    if args.fixture:
+        from recalcular_tabla import ClienteFixture
+        cliente = ClienteFixture(args.fixture)
+    elif args.api_key:
+        import googlemaps
+        cliente = googlemaps.Client(key=args.api_key)
+    else:
+        cliente = None
+    cache = cache_rutas.CacheRutas(args.cache_rutas, ttl_segundos=args.ttl_horas * 3600, max_entradas=args.max_entradas)
+    metricas.iniciar_publicacion()
+    servicio = Servicio(args.tiempos, cliente, cache, args.token, args.hilos_rutas)
+    uvicorn.run(crear_app(servicio), host=args.host, port=args.port, access_log=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+# benchmarks/bench.py
+# Benchmarks reproducibles (sin red) de los caminos calientes de la aplicación, sobre el
+# tiempos.csv incluido y sobre versiones sintéticas ampliadas, con puerta de regresión.
+#
+# Uso:
+#   python benchmarks/bench.py                       # mide y compara con benchmarks/baseline.json (sin ella, sale con 1)
+#   python benchmarks/bench.py --guardar-baseline    # mide y guarda la baseline de esta máquina
+#   python benchmarks/bench.py --escalas 1 10 --umbral 0.3 --fixture rutas_grabadas.json
+import argparse
+import gc
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import buscador  # noqa: E402
+import empleados  # noqa: E402
+import motor_calculo  # noqa: E402
+import tabla_tiempos  # noqa: E402
+from cache_rutas import clave_ruta  # noqa: E402
+from recalcular_tabla import ClienteFixture  # noqa: E402
+from rutas import calcular_minutos_con_limite  # noqa: E402
+
+BASELINE = os.path.join(RAIZ, 'benchmarks', 'baseline.json')
+FICHEROS_APP = [f for f in os.listdir(RAIZ) if f.endswith('.py')] + ['logo_digi.png']
+
+
+# --- DATOS SINTÉTICOS ---
+def escribir_tiempos(destino, escala):
+    # Cada réplica renombra las poblaciones para que el número de municipios crezca con la escala.
+    df = pd.read_csv(os.path.join(RAIZ, 'tiempos.csv'), delimiter=';', encoding='latin-1', dtype=str, keep_default_na=False)
+    copias = [df] + [df.assign(Poblacion_IC=df['Poblacion_IC'] + f" ({i})") for i in range(1, escala)]
+    pd.concat(copias, ignore_index=True).to_csv(destino, sep=';', encoding='latin-1', index=False)
+
+
+def escribir_empleados(destino, escala, semilla=0):
+    rng = np.random.default_rng(semilla)
+    n = 1000 * escala
+    provincias = np.array(sorted(tabla_tiempos.leer_csv_tiempos(os.path.join(RAIZ, 'tiempos.csv'))['provincia_ct'].unique()))
+    provincia = provincias[rng.integers(0, len(provincias), n)]
+    pd.DataFrame({
+        'PROVINCIA': provincia,
+        'EQUIPO': [f"Equipo {p} {e}" for p, e in zip(provincia, rng.integers(1, 6, n))],
+        'NOMBRE COMPLETO': [f"Persona{i} Apellido{i % 97}" for i in range(n)],
+        'EMAIL': [f"persona{i}@digi.es" for i in range(n)],
+        'PERSONAL': np.where(rng.random(n) < 0.9, 'Activo', 'Baja'),
+    }).to_csv(destino, sep='|', encoding='latin-1', index=False)
+
+
+def fixture_directions(destino, origenes_destinos, semilla=0):
+    # Respuestas con la forma de Google Directions (20 tramos por ruta).
+    rng = np.random.default_rng(semilla)
+    respuestas = {}
+    for origen, destino_ruta in origenes_destinos:
+        pasos = [{'distance': {'value': int(d)}, 'duration': {'value': int(s)}} for d, s in zip(rng.integers(50, 8000, 20), rng.integers(5, 400, 20))]
+        respuestas[clave_ruta(origen, destino_ruta, 'driving', 'tolls')] = [{'legs': [{'steps': pasos}]}]
+    with open(destino, 'w', encoding='utf-8') as f: json.dump(respuestas, f)
+
+
+# --- MEDICIÓN ---
+def medir(funcion, repeticiones):
+    funcion()  # calentamiento
+    tiempos = []
+    for _ in range(repeticiones):
+        gc.collect()
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    # La memoria se mide en una ejecución aparte: tracemalloc distorsiona los tiempos.
+    tracemalloc.start()
+    funcion()
+    pico = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    p50, p95, p99 = np.percentile(tiempos, [50, 95, 99])
+    return {'p50_ms': round(p50, 3), 'p95_ms': round(p95, 3), 'p99_ms': round(p99, 3), 'pico_mb': round(pico / 2 ** 20, 2)}
+
+
+def etapas(directorio, escala, fixture):
+    tiempos_csv, empleados_csv = os.path.join(directorio, 'tiempos.csv'), os.path.join(directorio, 'employees.csv')
+    tabla_tiempos.compilar_tabla(tiempos_csv)
+    df = tabla_tiempos.cargar_tiempos(tiempos_csv)
+    indice = tabla_tiempos.IndiceTiempos(df)
+    buscador_lugares = buscador.BuscadorLugares(df)
+    df_empleados = empleados.leer_empleados(empleados_csv)
+    directorio_empleados = empleados.DirectorioEmpleados(df_empleados)
+
+    provincia = indice.provincias[len(indice.provincias) // 2]
+    poblaciones = indice.poblaciones_de(provincia)
+
+    def tab1():
+        lista = indice.poblaciones_de(provincia)
+        entrada, salida = indice.buscar(provincia, lista[0]), indice.buscar(provincia, lista[-1])
+        motor_calculo.evaluar_trayectos(entrada.distancia, entrada.minutos_total, salida.distancia, salida.minutos_total, entrada.minutos_cargo, salida.minutos_cargo)
+
+    def email():
+        p = directorio_empleados.provincias[0]
+        equipo = directorio_empleados.equipos_de(p)[0]
+        directorio_empleados.personas_de(p)
+        empleados.DirectorioEmpleados.lista_markdown(directorio_empleados.destinatarios(directorio_empleados.miembros_de(p, equipo)))
+
+    centros = df[['centro_trabajo', 'poblacion']].drop_duplicates().head(50).itertuples(index=False)
+    pares = [(c, p) for c, p in centros]
+    if fixture is None:
+        fixture = os.path.join(directorio, 'directions.json')
+        fixture_directions(fixture, pares)
+    cliente = ClienteFixture(fixture)
+    claves = list(cliente.respuestas)
+    pares_fixture = [tuple(k.split('|')[2:4]) for k in claves]
+
+    def rutas():
+        for origen, destino in pares_fixture: calcular_minutos_con_limite(origen, destino, cliente)
+
+    resultados = {
+        'cargar_datos_csv (CSV)': (lambda: tabla_tiempos.leer_csv_tiempos(tiempos_csv), 5),
+        'cargar_datos_csv (compilado)': (lambda: tabla_tiempos.cargar_tiempos(tiempos_csv), 10),
+        'indice_tiempos': (lambda: tabla_tiempos.IndiceTiempos(df), 5),
+        'tab1 (filtrado y consulta)': (tab1, 200),
+        'buscador_lugares': (lambda: buscador.BuscadorLugares(df), 3),
+        'tab2 (sugerir x4)': (lambda: [buscador_lugares.sugerir(q) for q in ('lug', 'culeredo', '02035', 'alvacete')], 200),
+        'cargar_datos_empleados': (lambda: empleados.leer_empleados(empleados_csv), 5),
+        'directorio_empleados': (lambda: empleados.DirectorioEmpleados(df_empleados), 5),
+        'email_form (filtrado)': (email, 200),
+        f'calcular_minutos_con_limite (x{len(pares_fixture)})': (rutas, 20),
+    }
+    medidas = {nombre: medir(funcion, repeticiones) for nombre, (funcion, repeticiones) in resultados.items()}
+    medidas['rerun tab1 (AppTest, 4 reruns)'] = medir_rerun(directorio, provincia, poblaciones)
+    return {f"x{escala} | {nombre}": medida for nombre, medida in medidas.items() if medida is not None}
+
+
+def medir_rerun(directorio, provincia, poblaciones, repeticiones=10):
+    try: from streamlit.testing.v1 import AppTest
+    except ImportError: return None
+    import logging
+    import streamlit as st
+    logging.getLogger('streamlit').setLevel(logging.ERROR)
+    previo = os.getcwd()
+    os.chdir(directorio)  # la app abre sus ficheros con rutas relativas
+    try:
+        st.cache_data.clear(); st.cache_resource.clear()
+        at = AppTest.from_file(os.path.join(directorio, 'calcula_salida.py'), default_timeout=120)
+        at.secrets['google_api_key'] = 'AIza' + '0' * 35
+        at.session_state['authentication_status'] = True
+        at.session_state['username'] = 'benchmark'
+
+        def rerun():
+            at.run()
+            at.selectbox[0].select(provincia).run()
+            at.selectbox[1].select(poblaciones[0]).run()
+            at.selectbox[2].select(poblaciones[-1]).run()
+            if at.exception: raise RuntimeError(at.exception[0].value)
+        return medir(rerun, repeticiones)
+    finally:
+        os.chdir(previo)
+
+
+# --- PUERTA DE REGRESIÓN ---
+def comparar(medidas, baseline, umbral, holgura_ms):
+    regresiones = []
+    for nombre, medida in medidas.items():
+        base = baseline.get(nombre)
+        if base is None: continue
+        limite = base['p50_ms'] * (1 + umbral) + holgura_ms
+        if medida['p50_ms'] > limite: regresiones.append(f"{nombre}: p50 {medida['p50_ms']:.2f} ms > {limite:.2f} ms (baseline {base['p50_ms']:.2f} ms)")
+        if base.get('pico_mb') and medida['pico_mb'] > base['pico_mb'] * (1 + umbral) + 1:
+            regresiones.append(f"{nombre}: memoria {medida['pico_mb']:.1f} MB > baseline {base['pico_mb']:.1f} MB")
+    return regresiones
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks de los caminos calientes de la calculadora.")
+    parser.add_argument('--escalas', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--fixture', help="Respuestas de Directions grabadas con recalcular_tabla.py --grabar.")
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--guardar-baseline', action='store_true')
+    parser.add_argument('--umbral', type=float, default=0.25, help="Regresión tolerada sobre la p50 de la baseline (0.25 = 25%%).")
+    parser.add_argument('--holgura-ms', type=float, default=1.0, help="Margen absoluto para etapas muy rápidas.")
+    parser.add_argument('--salida', help="Guarda también las medidas de esta ejecución en JSON.")
+    args = parser.parse_args(argv)
+
+    medidas = {}
+    for escala in args.escalas:
+        directorio = tempfile.mkdtemp(prefix=f"bench_x{escala}_")
+        try:
+            for fichero in FICHEROS_APP: shutil.copy(os.path.join(RAIZ, fichero), directorio)
+            escribir_tiempos(os.path.join(directorio, 'tiempos.csv'), escala)
+            escribir_empleados(os.path.join(directorio, 'employees.csv'), escala)
+            medidas.update(etapas(directorio, escala, args.fixture))
+        finally:
+            shutil.rmtree(directorio, ignore_errors=True)
+
+    ancho = max(len(n) for n in medidas)
+    print(f"{'etapa':<{ancho}}  {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'pico MB':>9}")
+    for nombre, m in medidas.items():
+        print(f"{nombre:<{ancho}}  {m['p50_ms']:>10.2f} {m['p95_ms']:>10.2f} {m['p99_ms']:>10.2f} {m['pico_mb']:>9.2f}")
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f: json.dump(medidas, f, indent=2, ensure_ascii=False)
+
+    if args.guardar_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f: json.dump(medidas, f, indent=2, ensure_ascii=False)
+        print(f"Baseline guardada en {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        # Sin baseline no hay puerta: se falla para que una CI mal configurada no pase siempre en verde.
+        print(f"ERROR  no existe la baseline {args.baseline}: ejecuta con --guardar-baseline para crearla.")
+        return 1
+    with open(args.baseline, encoding='utf-8') as f: baseline = json.load(f)
+    regresiones = comparar(medidas, baseline, args.umbral, args.holgura_ms)
+    for regresion in regresiones: print(f"REGRESIÓN  {regresion}")
+    return 1 if regresiones else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
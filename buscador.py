@@ -0,0 +1,127 @@
+# buscador.py
+# Búsqueda local de lugares de tiempos.csv (poblaciones, municipios, códigos INE y centros de
+# trabajo) para sugerir y normalizar las direcciones de la pestaña 2 antes de llamar a Google.
+# Claves normalizadas sin tildes ni mayúsculas: índice de prefijos ordenado (bisect) y
+# trigramas con listas invertidas en numpy para las búsquedas aproximadas.
+import bisect
+import re
+import unicodedata
+from dataclasses import dataclass
+
+import numpy as np
+
+from tabla_tiempos import RegistroTiempo
+
+POBLACION, CENTRO = 'poblacion', 'centro'
+MAX_PREFIJOS = 200
+PUNTUACION_MINIMA = 0.35
+_NO_ALFANUMERICO = re.compile(r'[^0-9a-z]+')
+
+
+@dataclass(frozen=True, slots=True)
+class Lugar:
+    texto: str  # forma canónica, la que se envía a Google
+    tipo: str
+    provincia: str
+
+
+def normalizar(texto):
+    sin_tildes = unicodedata.normalize('NFKD', str(texto).lower()).encode('ascii', 'ignore').decode('ascii')
+    return ' '.join(_NO_ALFANUMERICO.sub(' ', sin_tildes).split())
+
+
+def trigramas(clave):
+    relleno = f"  {clave} "
+    return {relleno[i:i + 3] for i in range(len(relleno) - 2)}
+
+
+class BuscadorLugares:
+    __slots__ = ('version', 'lugares', '_por_texto', '_por_clave', '_claves', '_lugar_de_clave', '_orden_prefijos',
+                 '_trigramas', '_n_trigramas', '_tramos')
+
+    def __init__(self, df, version=None):
+        self.version = version
+        self.lugares, self._por_texto, self._tramos = [], {}, {}
+        claves, normalizadas = {}, {}
+
+        def alta(texto, tipo, provincia, *alias):
+            id_ = self._por_texto.get(texto)
+            if id_ is None:
+                id_ = self._por_texto[texto] = len(self.lugares)
+                self.lugares.append(Lugar(texto, tipo, provincia))
+            for alias_ in (texto,) + alias:
+                clave = normalizadas.get(alias_)
+                if clave is None: clave = normalizadas[alias_] = normalizar(alias_)
+                if clave: claves.setdefault(clave, {})[id_] = None
+            return id_
+
+        filas = zip(df['poblacion'].tolist(), df['provincia'].tolist(), df['municipio'].tolist(), df['cod_ine'].tolist(),
+                    df['centro_trabajo'].tolist(), df['provincia_ct'].tolist(),
+                    df['distancia'].tolist(), df['minutos_total'].tolist(), df['minutos_cargo'].tolist())
+        for poblacion, provincia, municipio, cod_ine, centro, provincia_ct, distancia, minutos_total, minutos_cargo in filas:
+            provincia = provincia or provincia_ct
+            # Misma forma que usa recalcular_tabla.py como destino: '{Poblacion_IC}, {Provincia_WFI}'.
+            texto = f"{poblacion}, {provincia}"
+            alta(texto, POBLACION, provincia, poblacion, municipio, cod_ine)
+            alta(centro, CENTRO, provincia_ct)
+            # Como en IndiceTiempos, manda la primera fila de cada combinación.
+            self._tramos.setdefault((centro, texto), RegistroTiempo(float(distancia), int(minutos_total), int(minutos_cargo), centro))
+
+        self._por_clave = {clave: tuple(ids) for clave, ids in claves.items()}
+        pares = sorted((clave, id_) for clave, ids in claves.items() for id_ in ids)
+        self._claves = [clave for clave, _ in pares]
+        self._lugar_de_clave = np.array([id_ for _, id_ in pares], dtype=np.int32)
+        self._orden_prefijos = np.array([len(clave) for clave in self._claves], dtype=np.int32)
+        listas, self._n_trigramas = {}, np.empty(len(self._claves), dtype=np.int32)
+        for i, clave in enumerate(self._claves):
+            de_clave = trigramas(clave)
+            self._n_trigramas[i] = len(de_clave)
+            for trigrama in de_clave: listas.setdefault(trigrama, []).append(i)
+        self._trigramas = {trigrama: np.array(ids, dtype=np.int32) for trigrama, ids in listas.items()}
+
+    def lugar(self, texto):
+        id_ = self._por_texto.get(texto.strip())
+        return None if id_ is None else self.lugares[id_]
+
+    def _prefijo(self, clave):
+        inicio = bisect.bisect_left(self._claves, clave)
+        fin = bisect.bisect_left(self._claves, clave + '\x7f', inicio, min(inicio + MAX_PREFIJOS, len(self._claves)))
+        # Las claves más cortas primero: "lug" propone "Lugo" antes que "Lugar Nuevo de ...".
+        posiciones = np.arange(inicio, fin)
+        return self._lugar_de_clave[posiciones[np.argsort(self._orden_prefijos[posiciones], kind='stable')]]
+
+    def _aproximados(self, clave, limite):
+        consulta = trigramas(clave)
+        listas = [self._trigramas[t] for t in consulta if t in self._trigramas]
+        if not listas: return np.empty(0, dtype=np.int32), np.empty(0)
+        comunes = np.bincount(np.concatenate(listas), minlength=len(self._claves))
+        puntos = 2 * comunes / (len(consulta) + self._n_trigramas)  # coeficiente de Dice
+        k = min(limite * 4, len(puntos))
+        mejores = np.argpartition(-puntos, k - 1)[:k]
+        mejores = mejores[np.argsort(-puntos[mejores], kind='stable')]
+        mejores = mejores[puntos[mejores] >= PUNTUACION_MINIMA]
+        return self._lugar_de_clave[mejores], puntos[mejores]
+
+    def sugerir(self, texto, limite=8):
+        clave = normalizar(texto)
+        if not clave: return []
+        ids = dict.fromkeys(self._prefijo(clave).tolist())
+        if len(ids) < limite: ids.update(dict.fromkeys(self._aproximados(clave, limite)[0].tolist()))
+        return [self.lugares[id_] for id_ in list(ids)[:limite]]
+
+    def canonizar(self, texto, umbral=0.75, margen=0.1):
+        # Solo se devuelve un lugar si no hay ambigüedad: coincidencia exacta (sin tildes ni
+        # mayúsculas) con un único lugar, o una aproximada clara y destacada sobre la siguiente.
+        clave = normalizar(texto)
+        if not clave: return None
+        ids = self._por_clave.get(clave)
+        if ids: return self.lugares[ids[0]] if len(ids) == 1 else None
+        lugares, puntos = self._aproximados(clave, 2)
+        if not len(lugares) or puntos[0] < umbral: return None
+        siguiente = next((p for id_, p in zip(lugares[1:], puntos[1:]) if id_ != lugares[0]), 0.0)
+        return self.lugares[lugares[0]] if puntos[0] - siguiente >= margen else None
+
+    def tramo_oficial(self, origen, destino):
+        # La tabla da el trayecto centro <-> población; se acepta en los dos sentidos.
+        origen, destino = origen.strip(), destino.strip()
+        return self._tramos.get((origen, destino)) or self._tramos.get((destino, origen))
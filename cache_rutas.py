@@ -0,0 +1,113 @@
+# cache_rutas.py
+# Caché persistente (SQLite) de rutas calculadas con Google Directions, compartida
+# por todas las sesiones y procesos. Caducidad por TTL y expulsión LRU por tamaño.
+import sqlite3
+import threading
+import time
+
+# Las lecturas no escriben en la base: último acceso y contadores se acumulan en memoria y se
+# vuelcan en una sola transacción cada VOLCADO_LECTURAS lecturas, VOLCADO_SEGUNDOS o en guardar().
+VOLCADO_LECTURAS = 100
+VOLCADO_SEGUNDOS = 30.0
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS rutas (
+    clave TEXT PRIMARY KEY,
+    distancia_km REAL NOT NULL,
+    minutos INTEGER NOT NULL,
+    creado REAL NOT NULL,
+    ultimo_acceso REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS rutas_ultimo_acceso ON rutas (ultimo_acceso);
+CREATE TABLE IF NOT EXISTS contadores (
+    nombre TEXT PRIMARY KEY,
+    valor INTEGER NOT NULL
+);
+"""
+
+
+def normalizar_lugar(texto):
+    return " ".join(str(texto).lower().split())
+
+
+def clave_ruta(origen, destino, mode="driving", avoid="tolls"):
+    return "|".join([mode or "", avoid or "", normalizar_lugar(origen), normalizar_lugar(destino)])
+
+
+class CacheRutas:
+    def __init__(self, ruta="rutas_cache.sqlite", ttl_segundos=30 * 24 * 3600, max_entradas=20000):
+        self.ruta, self.ttl_segundos, self.max_entradas = ruta, ttl_segundos, max_entradas
+        self._local = threading.local()
+        self._lock, self._accesos, self._contadores, self._ultimo_volcado = threading.Lock(), {}, {}, time.monotonic()
+        with self._conexion() as con: con.executescript(ESQUEMA)
+
+    # Una conexión por hilo: Streamlit atiende cada sesión en su propio hilo.
+    def _conexion(self):
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.ruta, timeout=10)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            self._local.con = con
+        return con
+
+    def _anotar(self, nombre, clave=None, ahora=None):
+        with self._lock:
+            self._contadores[nombre] = self._contadores.get(nombre, 0) + 1
+            if clave is not None: self._accesos[clave] = ahora
+            toca = sum(self._contadores.values()) >= VOLCADO_LECTURAS or time.monotonic() - self._ultimo_volcado >= VOLCADO_SEGUNDOS
+        if toca: self.volcar()
+
+    def _tomar_pendientes(self):
+        with self._lock:
+            pendientes = self._accesos, self._contadores
+            self._accesos, self._contadores, self._ultimo_volcado = {}, {}, time.monotonic()
+        return pendientes
+
+    def _devolver_pendientes(self, accesos, contadores):
+        with self._lock:
+            for clave, instante in accesos.items(): self._accesos[clave] = max(instante, self._accesos.get(clave, 0))
+            for nombre, n in contadores.items(): self._contadores[nombre] = self._contadores.get(nombre, 0) + n
+
+    def _escribir_pendientes(self, con, accesos, contadores):
+        con.executemany("UPDATE rutas SET ultimo_acceso = MAX(ultimo_acceso, ?) WHERE clave = ?", [(instante, clave) for clave, instante in accesos.items()])
+        con.executemany("INSERT INTO contadores (nombre, valor) VALUES (?, ?) ON CONFLICT(nombre) DO UPDATE SET valor = valor + excluded.valor", list(contadores.items()))
+
+    def volcar(self):
+        accesos, contadores = self._tomar_pendientes()
+        if not (accesos or contadores): return
+        try:
+            with self._conexion() as con: self._escribir_pendientes(con, accesos, contadores)
+        except sqlite3.Error:
+            # Base ocupada o sin espacio: se conservan para el siguiente volcado.
+            self._devolver_pendientes(accesos, contadores)
+
+    def obtener(self, origen, destino, mode="driving", avoid="tolls"):
+        clave, ahora = clave_ruta(origen, destino, mode, avoid), time.time()
+        fila = self._conexion().execute("SELECT distancia_km, minutos, creado FROM rutas WHERE clave = ?", (clave,)).fetchone()
+        # Una entrada caducada cuenta como fallo; la sustituye el siguiente guardar() o la expulsa el LRU.
+        if fila is None or ahora - fila[2] > self.ttl_segundos:
+            self._anotar("misses")
+            return None
+        self._anotar("hits", clave, ahora)
+        return fila[0], fila[1]
+
+    def guardar(self, origen, destino, distancia_km, minutos, mode="driving", avoid="tolls"):
+        clave, ahora = clave_ruta(origen, destino, mode, avoid), time.time()
+        accesos, contadores = self._tomar_pendientes()
+        try:
+            with self._conexion() as con:
+                self._escribir_pendientes(con, accesos, contadores)
+                con.execute("INSERT OR REPLACE INTO rutas (clave, distancia_km, minutos, creado, ultimo_acceso) VALUES (?, ?, ?, ?, ?)",
+                            (clave, distancia_km, minutos, ahora, ahora))
+                con.execute("DELETE FROM rutas WHERE clave IN (SELECT clave FROM rutas ORDER BY ultimo_acceso DESC LIMIT -1 OFFSET ?)", (self.max_entradas,))
+        except sqlite3.Error:
+            self._devolver_pendientes(accesos, contadores)
+            raise
+
+    def estadisticas(self):
+        self.volcar()
+        con = self._conexion()
+        contadores = dict(con.execute("SELECT nombre, valor FROM contadores").fetchall())
+        entradas = con.execute("SELECT COUNT(*) FROM rutas").fetchone()[0]
+        return {"hits": contadores.get("hits", 0), "misses": contadores.get("misses", 0), "entradas": entradas}
@@ -1,12 +1,19 @@
 # app.py
 import streamlit as st
 import pandas as pd
+import numpy as np
 import googlemaps
 import datetime as dt
-import math
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import tabla_tiempos
+import cache_rutas
+import rutas
+import motor_calculo
+import planificador
+import correo
+import empleados
+import recarga
+import metricas
+import buscador
 
 # --- CONFIGURACIÓN DE LA PÁGINA ---
 st.set_page_config(page_title="Calculadora y Notificaciones DIGI", page_icon="🚗", layout="centered")
@@ -37,159 +44,104 @@ def check_login():
     return False
 
 # --- LÓGICA DE CÁLCULO ---
-@st.cache_data
+# Cada fichero de datos se vigila en segundo plano y se recarga (con sus índices) al cambiar.
+@st.cache_resource
+def tiempos_vivos(filename):
+    # El buscador de lugares tarda bastante más que el índice y solo lo usa la pestaña 2: se construye en segundo plano.
+    return recarga.DatosVivos(filename, tabla_tiempos.cargar_tiempos, {'indice': tabla_tiempos.IndiceTiempos}, diferidos={'buscador': buscador.BuscadorLugares})
+
+@metricas.medido('app.cargar_datos_csv')
 def cargar_datos_csv(filename):
     try:
-        df = pd.read_csv(filename, delimiter=';', encoding='latin-1', header=0)
-        
-        col_poblacion = 'Poblacion_IC'
-        col_centro_trabajo = 'Centro de Trabajo Nuevo'
-        col_provincia_ct = 'Provincia Centro de Trabajo'
-        col_distancia = 'Distancia en Kms'
-        col_minutos_total = 'Tiempo(Min)'
-        col_minutos_cargo = 'Tiempo a cargo de empresa(Min)'
-
-        df.rename(columns={
-            col_poblacion: 'poblacion',
-            col_centro_trabajo: 'centro_trabajo',
-            col_provincia_ct: 'provincia_ct',
-            col_distancia: 'distancia',
-            col_minutos_total: 'minutos_total',
-            col_minutos_cargo: 'minutos_cargo'
-        }, inplace=True)
-
-        required_cols = ['poblacion', 'centro_trabajo', 'provincia_ct', 'distancia', 'minutos_total', 'minutos_cargo']
-        if not all(col in df.columns for col in required_cols):
-            st.error(f"Error Crítico: El archivo '{filename}' no contiene todas las columnas necesarias. Revisa que existan: {required_cols}.")
-            return None
-
-        df_clean = df[required_cols].dropna(subset=['poblacion', 'centro_trabajo', 'provincia_ct'])
-        for col in ['poblacion', 'centro_trabajo', 'provincia_ct']:
-            df_clean[col] = df_clean[col].str.strip()
-        
-        for col in ['distancia', 'minutos_total', 'minutos_cargo']:
-            df_clean[col] = df_clean[col].astype(str).str.replace(',', '.', regex=False)
-            df_clean[col] = pd.to_numeric(df_clean[col], errors='coerce').fillna(0)
-
-        df_clean['minutos_total'] = df_clean['minutos_total'].astype(int)
-        df_clean['minutos_cargo'] = df_clean['minutos_cargo'].astype(int)
-        
-        return df_clean
-
+        return tiempos_vivos(filename).actual()
+    except tabla_tiempos.ColumnasFaltantes as e:
+        st.error(f"Error Crítico: {e}")
+        return None
     except Exception as e:
         st.error(f"Error al procesar el archivo '{filename}': {e}")
         return None
 
-def calcular_minutos_con_limite(origen, destino, gmaps_client):
-    try:
-        directions_result = gmaps_client.directions(origen, destino, mode="driving", avoid="tolls")
-        if not directions_result or not directions_result[0]['legs']:
-            return None, None, "No se pudo encontrar una ruta para las direcciones proporcionadas."
-        
-        steps = directions_result[0]['legs'][0]['steps']
-        total_capped_duration_seconds, total_distance_meters = 0, 0
-        for step in steps:
-            distancia_metros = step['distance']['value']
-            duracion_google_seg = step['duration']['value']
-            total_distance_meters += distancia_metros
-            theoretical_duration_90kmh_seg = (distancia_metros / 1000) / (90 / 3600) if distancia_metros > 0 else 0
-            capped_duration_seg = max(duracion_google_seg, theoretical_duration_90kmh_seg)
-            total_capped_duration_seconds += capped_duration_seg
-        total_distancia_km = total_distance_meters / 1000
-        total_minutos_final = math.ceil(total_capped_duration_seconds / 60)
-        return total_distancia_km, total_minutos_final, None
-    except googlemaps.exceptions.ApiError as e: return None, None, f"Error de la API de Google: {e}"
-    except Exception as e: return None, None, f"Error inesperado: {e}"
+@st.cache_resource
+def obtener_cache_rutas():
+    try: cfg = dict(st.secrets.get("route_cache", {}))
+    except Exception: cfg = {}
+    return cache_rutas.CacheRutas(cfg.get("path", "rutas_cache.sqlite"), ttl_segundos=float(cfg.get("ttl_hours", 24 * 30)) * 3600, max_entradas=int(cfg.get("max_entries", 20000)))
+
+@st.cache_resource
+def obtener_resolutor_rutas():
+    return rutas.ResolutorRutas()
 
 def mostrar_horas_de_salida(total_minutos_desplazamiento):
     st.markdown("---"); st.subheader("🕒 Horas de Salida Sugeridas")
-    dias_es = {"Monday": "Lunes", "Tuesday": "Martes", "Wednesday": "Miércoles", "Thursday": "Jueves", "Friday": "Viernes"}
-    meses_es = {"January": "enero", "February": "febrero", "March": "marzo", "April": "abril", "May": "mayo", "June": "junio", "July": "julio", "August": "agosto", "September": "septiembre", "October": "octubre", "November": "noviembre", "December": "diciembre"}
     hoy = dt.date.today()
-    dia_en, mes_en = hoy.strftime('%A'), hoy.strftime('%B')
-    fecha_formateada = f"{dias_es.get(dia_en, dia_en)} {hoy.day} de {meses_es.get(mes_en, mes_en)}"
+    fecha_formateada = motor_calculo.formatear_fechas(hoy)[0]
     st.session_state.calculation_results['fecha'] = fecha_formateada
-    es_viernes = (hoy.weekday() == 4)
-    horarios_base = {"Verano": (dt.time(14, 0) if es_viernes else dt.time(15, 0)), "Habitual Intensivo": (dt.time(15, 0) if es_viernes else dt.time(16, 0)), "Normal": (dt.time(16, 0) if es_viernes else dt.time(17, 0))}
+    horarios_hoy = motor_calculo.horarios_base(hoy).iloc[0]
+    horas_salida_hoy = motor_calculo.horas_de_salida(hoy, total_minutos_desplazamiento).iloc[0].to_dict()
     tabla_rows = [f"| Horario | Hora Salida Habitual | Hora Salida Hoy ({fecha_formateada}) |", "|---|---|---|"]
-    horas_salida_hoy = {}
-    for nombre, hora_habitual in horarios_base.items():
-        salida_dt_hoy = dt.datetime.combine(hoy, hora_habitual) - dt.timedelta(minutes=total_minutos_desplazamiento)
-        hora_salida_str = salida_dt_hoy.strftime('%H:%M')
-        horas_salida_hoy[nombre] = hora_salida_str
-        tabla_rows.append(f"| **{nombre}** | {hora_habitual.strftime('%H:%M')} | **{hora_salida_str}** |")
+    for nombre, hora_salida_str in horas_salida_hoy.items():
+        tabla_rows.append(f"| **{nombre}** | {horarios_hoy[nombre].strftime('%H:%M')} | **{hora_salida_str}** |")
     st.session_state.calculation_results['horas_salida'] = horas_salida_hoy
     st.markdown("\n".join(tabla_rows))
 
-@st.cache_data
+@st.cache_resource
+def empleados_vivos(filename):
+    return recarga.DatosVivos(filename, empleados.leer_empleados, {'directorio': empleados.DirectorioEmpleados})
+
+@metricas.medido('app.cargar_datos_empleados')
 def cargar_datos_empleados(filename="employees.csv"):
-    try:
-        df = pd.read_csv(filename, delimiter='|', encoding='latin-1')
-        required_cols = ['PROVINCIA', 'EQUIPO', 'NOMBRE COMPLETO', 'EMAIL', 'PERSONAL']
-        if not all(col in df.columns for col in required_cols):
-            missing_cols = [col for col in required_cols if col not in df.columns]
-            st.error(f"❌ Error en '{filename}': Faltan las siguientes columnas obligatorias: {missing_cols}")
-            return None
-        df = df.dropna(subset=required_cols)
-        for col in required_cols: 
-            if isinstance(df[col].iloc[0], str):
-                df[col] = df[col].str.strip()
-        df_activos = df[df['PERSONAL'].str.lower() == 'activo'].copy()
-        return df_activos
+    try: return empleados_vivos(filename).actual()
+    except empleados.ColumnasFaltantes as e: st.error(f"❌ Error en '{filename}': {e}"); return None
     except FileNotFoundError: st.error(f"❌ Error: No se encuentra el archivo '{filename}'."); return None
     except Exception as e: st.error(f"Error al procesar '{filename}'. Error: {e}"); return None
 
 # --- APLICACIÓN DE CÁLCULO ---
+@metricas.medido('calculadora')
 def full_calculator_app():
     st.image("logo_digi.png", width=250)
     st.title(f"Bienvenido, {st.session_state['username']}!")
     
-    df_tiempos = cargar_datos_csv('tiempos.csv')
-
-    def _cargo(minutos):
-        return max(0, minutos - 30)
+    tiempos = cargar_datos_csv('tiempos.csv')
+    df_tiempos = tiempos.datos if tiempos is not None else None
+    if tiempos is not None: indice_tiempos = tiempos.derivados['indice']
 
-    tab1, tab2 = st.tabs([" Cálculo oficial DIGI (basado en distancias 2.2) ", "  (Cálculo fuera de la tabla con método DIGI solo informativo)  "])
+    tab1, tab2, tab3 = st.tabs([" Cálculo oficial DIGI (basado en distancias 2.2) ", "  (Cálculo fuera de la tabla con método DIGI solo informativo)  ", " Planificador semanal "])
     
-    with tab1:
+    with tab1, metricas.medir('calculadora.tab1'):
         st.header("Cálculo de tiempos desde el archivo")
         if df_tiempos is not None:
-            provincias_ct = sorted(df_tiempos['provincia_ct'].unique())
-            provincia_seleccionada = st.selectbox("1. Selecciona la provincia del Centro de Trabajo:",provincias_ct, index=None, placeholder="Elige una provincia")
+            provincia_seleccionada = st.selectbox("1. Selecciona la provincia del Centro de Trabajo:",indice_tiempos.provincias, index=None, placeholder="Elige una provincia")
             if provincia_seleccionada:
-                df_filtrado = df_tiempos[df_tiempos['provincia_ct'] == provincia_seleccionada]
-                lista_poblaciones = sorted(df_filtrado['poblacion'].unique())
+                lista_poblaciones = indice_tiempos.poblaciones_de(provincia_seleccionada)
                 st.markdown("---")
                 col1, col2 = st.columns(2)
                 with col1:
                     mun_entrada = st.selectbox("2. Destino del comienzo de la jornada:", lista_poblaciones, index=None, placeholder="Selecciona una población")
                     if mun_entrada:
-                        info_entrada = df_filtrado[df_filtrado['poblacion'] == mun_entrada].iloc[0]
-                        st.info(f"**Centro de Trabajo:** {info_entrada['centro_trabajo']}")
+                        datos_entrada = indice_tiempos.buscar(provincia_seleccionada, mun_entrada)
+                        st.info(f"**Centro de Trabajo:** {datos_entrada.centro_trabajo}")
                 with col2:
                     mun_salida = st.selectbox("3. Destino del final de la jornada:", lista_poblaciones, index=None, placeholder="Selecciona una población")
                     if mun_salida:
-                        info_salida = df_filtrado[df_filtrado['poblacion'] == mun_salida].iloc[0]
-                        st.info(f"**Centro de Trabajo:** {info_salida['centro_trabajo']}")
+                        datos_salida = indice_tiempos.buscar(provincia_seleccionada, mun_salida)
+                        st.info(f"**Centro de Trabajo:** {datos_salida.centro_trabajo}")
                 if mun_entrada and mun_salida:
                     st.markdown("---")
-                    datos_entrada = df_filtrado[df_filtrado['poblacion'] == mun_entrada].iloc[0]
-                    datos_salida = df_filtrado[df_filtrado['poblacion'] == mun_salida].iloc[0]
+                    min_total_entrada = datos_entrada.minutos_total
+                    dist_entrada = datos_entrada.distancia
+                    min_cargo_entrada = datos_entrada.minutos_cargo
                     
-                    min_total_entrada = int(datos_entrada['minutos_total'])
-                    dist_entrada = float(datos_entrada['distancia'])
-                    min_cargo_entrada = int(datos_entrada['minutos_cargo'])
-                    
-                    min_total_salida = int(datos_salida['minutos_total'])
-                    dist_salida = float(datos_salida['distancia'])
-                    min_cargo_salida = int(datos_salida['minutos_cargo'])
+                    min_total_salida = datos_salida.minutos_total
+                    dist_salida = datos_salida.distancia
+                    min_cargo_salida = datos_salida.minutos_cargo
                     
+                    evaluacion = motor_calculo.evaluar_trayectos(dist_entrada, min_total_entrada, dist_salida, min_total_salida, min_cargo_entrada, min_cargo_salida).iloc[0]
                     st.session_state.calculation_results.update({
-                        'aviso_pernocta': min_total_entrada > 80 or min_total_salida > 80,
-                        'aviso_dieta': dist_entrada > 40 or dist_salida > 40,
-                        'aviso_jornada': min_total_entrada > 60 or min_total_salida > 60,
-                        'trayecto_entrada': f"De `{datos_entrada['centro_trabajo']}` a `{mun_entrada}`",
-                        'trayecto_salida': f"De `{mun_salida}` a `{datos_salida['centro_trabajo']}`"
+                        'aviso_pernocta': bool(evaluacion['aviso_pernocta']),
+                        'aviso_dieta': bool(evaluacion['aviso_dieta']),
+                        'aviso_jornada': bool(evaluacion['aviso_jornada']),
+                        'trayecto_entrada': f"De `{datos_entrada.centro_trabajo}` a `{mun_entrada}`",
+                        'trayecto_salida': f"De `{mun_salida}` a `{datos_salida.centro_trabajo}`"
                     })
                     if st.session_state.calculation_results['aviso_pernocta']: st.warning("🛌 **Aviso Pernocta:** Uno o ambos trayectos superan los 80 minutos.")
                     if st.session_state.calculation_results['aviso_dieta']: st.warning("⚠️ **Atención Media Dieta:** Uno o ambos trayectos superan los 40km.")
@@ -215,28 +167,72 @@ def full_calculator_app():
                     
                     st.markdown("---")
                     
-                    total_minutos_a_cargo = min_cargo_entrada + min_cargo_salida
+                    total_minutos_a_cargo = int(evaluacion['total_minutos'])
                     st.success(f"**Tiempo total a restar de la jornada:** {total_minutos_a_cargo} minutos")
                     
                     mostrar_horas_de_salida(total_minutos_a_cargo)
                     st.session_state.calculation_results['total_minutos'] = total_minutos_a_cargo
                     if st.button("📧 Enviar mail al equipo", key="btn_csv_mail"): st.session_state.page = 'email_form'; st.rerun()
 
-    with tab2:
+    # La pestaña 2 puede detener el script (st.stop) si falta la clave de Google; el planificador se pinta antes.
+    with tab3, metricas.medir('calculadora.tab3'):
+        st.header("Planificación de varios días")
+        if df_tiempos is not None:
+            provincia_plan = st.selectbox("Provincia del Centro de Trabajo:", indice_tiempos.provincias, index=None, placeholder="Elige una provincia", key='provincia_plan')
+            if provincia_plan:
+                poblaciones_plan = indice_tiempos.poblaciones_de(provincia_plan)
+                fichero_plan = st.file_uploader("Sube un CSV con las columnas fecha;entrada;salida (opcional: provincia) o rellena la tabla:", type=['csv'])
+                if fichero_plan is not None:
+                    try: asignaciones = planificador.leer_asignaciones(fichero_plan)
+                    except Exception as e: st.error(f"Error al leer el archivo: {e}"); asignaciones = None
+                else:
+                    hoy = dt.date.today()
+                    plantilla = pd.DataFrame({'fecha': [hoy + dt.timedelta(days=i) for i in range(5)], 'entrada': [None] * 5, 'salida': [None] * 5})
+                    asignaciones = st.data_editor(plantilla, num_rows="dynamic", hide_index=True, key='editor_plan', column_config={
+                        'fecha': st.column_config.DateColumn("Fecha", format="DD/MM/YYYY", required=True),
+                        'entrada': st.column_config.SelectboxColumn("Comienzo de la jornada", options=poblaciones_plan),
+                        'salida': st.column_config.SelectboxColumn("Final de la jornada", options=poblaciones_plan)})
+                    asignaciones = asignaciones.dropna(subset=['fecha', 'entrada', 'salida'])
+                if asignaciones is not None and not asignaciones.empty:
+                    plan = planificador.planificar(asignaciones, indice_tiempos, provincia_plan)
+                    if (plan['error'] != '').any(): st.warning(f"⚠️ {(plan['error'] != '').sum()} asignaciones con errores (ver columna 'error').")
+                    avisos = plan[['aviso_pernocta', 'aviso_dieta', 'aviso_jornada']].fillna(False).astype(bool).sum()
+                    st.caption(f"Días con aviso de pernocta: {avisos['aviso_pernocta']} · media dieta: {avisos['aviso_dieta']} · jornada especial: {avisos['aviso_jornada']}")
+                    st.dataframe(plan, hide_index=True)
+                    st.download_button("⬇️ Descargar planificación (CSV)", planificador.exportar_csv(plan), file_name=f"planificacion_{provincia_plan}.csv", mime="text/csv")
+
+    with tab2, metricas.medir('calculadora.tab2'):
         st.header("Cálculo por distancia (Reglas ponderadas)")
         try: gmaps = googlemaps.Client(key=st.secrets["google_api_key"])
         except Exception: st.error("Error: La clave de API de Google no está disponible."); st.stop()
         
-        centros_map, lista_provincias_ct = {}, ["(Escribir dirección manual)"]
+        centros_map, lista_provincias_ct, buscador_lugares = {}, ["(Escribir dirección manual)"], None
         if df_tiempos is not None:
-            centros_df = df_tiempos[['provincia_ct', 'centro_trabajo']].drop_duplicates(subset=['provincia_ct'])
-            centros_map = pd.Series(centros_df.centro_trabajo.values, index=centros_df.provincia_ct).to_dict()
-            lista_provincias_ct.extend(sorted(centros_map.keys()))
+            centros_map = indice_tiempos.centros
+            lista_provincias_ct.extend(indice_tiempos.provincias)
+            buscador_lugares = tiempos.derivados.get('buscador')  # None mientras se construye
 
         def update_field_from_select(field_key, select_key):
             provincia = st.session_state[select_key]
             if provincia in centros_map: st.session_state[field_key] = centros_map[provincia]
             st.session_state.gmaps_results = None
+
+        # Al editar un campo se sustituye por su forma canónica si la tabla lo identifica sin ambigüedad.
+        def canonizar_campo(field_key):
+            st.session_state.gmaps_results = None
+            lugar = buscador_lugares.canonizar(st.session_state[field_key]) if buscador_lugares else None
+            if lugar: st.session_state[field_key] = lugar.texto
+
+        def elegir_sugerencia(field_key):
+            if st.session_state[f"sugerencia_{field_key}"]: st.session_state[field_key] = st.session_state[f"sugerencia_{field_key}"]
+            st.session_state.gmaps_results = None
+
+        def campo_direccion(etiqueta, field_key):
+            valor = st.text_input(etiqueta, key=field_key, on_change=canonizar_campo, args=(field_key,))
+            if buscador_lugares and valor.strip() and buscador_lugares.lugar(valor) is None:
+                sugerencias = [lugar.texto for lugar in buscador_lugares.sugerir(valor, 5)]
+                if sugerencias: st.pills("¿Quisiste decir...?", sugerencias, key=f"sugerencia_{field_key}", on_change=elegir_sugerencia, args=(field_key,))
+            return valor
         
         if 'origen_ida' not in st.session_state: st.session_state.origen_ida = ""
         if 'destino_vuelta' not in st.session_state: st.session_state.destino_vuelta = ""
@@ -244,49 +240,60 @@ def full_calculator_app():
         col1_g, col2_g = st.columns(2)
         with col1_g:
             st.selectbox("Ayuda: Seleccionar centro (Origen ida)", lista_provincias_ct, key='origen_ida_select', on_change=update_field_from_select, args=('origen_ida', 'origen_ida_select'))
-            origen_ida = st.text_input("Origen (ida)", key="origen_ida", on_change=lambda: st.session_state.update(gmaps_results=None))
-            destino_ida = st.text_input("Destino (ida)", key="destino_ida", on_change=lambda: st.session_state.update(gmaps_results=None))
+            origen_ida = campo_direccion("Origen (ida)", "origen_ida")
+            destino_ida = campo_direccion("Destino (ida)", "destino_ida")
         with col2_g:
-            origen_vuelta = st.text_input("Origen (vuelta)", key="origen_vuelta", on_change=lambda: st.session_state.update(gmaps_results=None))
+            origen_vuelta = campo_direccion("Origen (vuelta)", "origen_vuelta")
             st.selectbox("Ayuda: Seleccionar centro (Destino vuelta)", lista_provincias_ct, key='destino_vuelta_select', on_change=update_field_from_select, args=('destino_vuelta', 'destino_vuelta_select'))
-            destino_vuelta = st.text_input("Destino (vuelta)", key="destino_vuelta", on_change=lambda: st.session_state.update(gmaps_results=None))
+            destino_vuelta = campo_direccion("Destino (vuelta)", "destino_vuelta")
         
         if st.button("Calcular Tiempo por Distancia", type="primary"):
             if all([origen_ida, destino_ida, origen_vuelta, destino_vuelta]):
-                with st.spinner('Calculando...'):
-                    dist_ida, min_ida, err_ida = calcular_minutos_con_limite(origen_ida, destino_ida, gmaps)
-                    dist_vuelta, min_vuelta, err_vuelta = calcular_minutos_con_limite(origen_vuelta, destino_vuelta, gmaps)
+                # Por si los campos se editaron antes de que el buscador estuviera listo.
+                if buscador_lugares:
+                    origen_ida, destino_ida, origen_vuelta, destino_vuelta = [getattr(buscador_lugares.canonizar(texto), 'texto', texto) for texto in (origen_ida, destino_ida, origen_vuelta, destino_vuelta)]
+                tramo_ida, tramo_vuelta = (buscador_lugares.tramo_oficial(origen_ida, destino_ida), buscador_lugares.tramo_oficial(origen_vuelta, destino_vuelta)) if buscador_lugares else (None, None)
+                if tramo_ida and tramo_vuelta:
+                    # Los dos trayectos están en la tabla oficial: se responde desde ella sin consultar Google.
+                    metricas.contar('buscador.respuestas_tabla')
+                    st.session_state.gmaps_results = {"dist_ida": tramo_ida.distancia, "min_ida": tramo_ida.minutos_total, "cargo_ida": tramo_ida.minutos_cargo,
+                                                      "dist_vuelta": tramo_vuelta.distancia, "min_vuelta": tramo_vuelta.minutos_total, "cargo_vuelta": tramo_vuelta.minutos_cargo, "fuente": "tabla"}
+                else:
+                    with st.spinner('Calculando...'):
+                        (dist_ida, min_ida, err_ida), (dist_vuelta, min_vuelta, err_vuelta) = obtener_resolutor_rutas().resolver_ida_vuelta(
+                            origen_ida, destino_ida, origen_vuelta, destino_vuelta, gmaps, obtener_cache_rutas())
                     if err_ida or err_vuelta:
                         if err_ida: st.error(f"Error ida: {err_ida}")
                         if err_vuelta: st.error(f"Error vuelta: {err_vuelta}")
                         st.session_state.gmaps_results = None
                     else:
                         st.session_state.gmaps_results = {"dist_ida": dist_ida, "min_ida": min_ida, "dist_vuelta": dist_vuelta, "min_vuelta": min_vuelta}
-                        st.session_state.calculation_results.update({
-                            'trayecto_entrada': f"De `{origen_ida}` a `{destino_ida}`",
-                            'trayecto_salida': f"De `{origen_vuelta}` a `{destino_vuelta}`"
-                        })
+                if st.session_state.gmaps_results:
+                    st.session_state.calculation_results.update({
+                        'trayecto_entrada': f"De `{origen_ida}` a `{destino_ida}`",
+                        'trayecto_salida': f"De `{origen_vuelta}` a `{destino_vuelta}`"
+                    })
             else: st.warning("Por favor, rellene las cuatro direcciones."); st.session_state.gmaps_results = None
         if st.session_state.gmaps_results:
             res = st.session_state.gmaps_results
-            es_identico = origen_ida.strip().lower() == destino_vuelta.strip().lower() and destino_ida.strip().lower() == origen_vuelta.strip().lower()
+            es_identico = motor_calculo.es_trayecto_identico(origen_ida, destino_ida, origen_vuelta, destino_vuelta)
+            evaluacion = motor_calculo.evaluar_trayectos(res['dist_ida'], res['min_ida'], res['dist_vuelta'], res['min_vuelta'], res.get('cargo_ida'), res.get('cargo_vuelta'), identico=es_identico).iloc[0]
+            if res.get('fuente') == 'tabla': st.caption("📋 Trayectos encontrados en la tabla oficial: no se ha consultado Google.")
+            st.session_state.calculation_results.update({aviso: bool(evaluacion[aviso]) for aviso in ('aviso_pernocta', 'aviso_dieta', 'aviso_jornada')})
             if es_identico:
                 st.info("ℹ️ Detectado trayecto de ida y vuelta idéntico.")
-                dist, mins = (res['dist_ida'], res['min_ida']) if res['min_ida'] >= res['min_vuelta'] else (res['dist_vuelta'], res['min_vuelta'])
-                st.session_state.calculation_results.update({'aviso_pernocta': mins > 80, 'aviso_dieta': dist > 40, 'aviso_jornada': mins > 60})
+                dist, mins = evaluacion['distancia_larga'], evaluacion['minutos_larga']
                 if st.session_state.calculation_results['aviso_pernocta']: st.warning(f"🛌 **Aviso Pernocta:** El trayecto ({mins} min) supera los 80 minutos.")
                 if st.session_state.calculation_results['aviso_dieta']: st.warning(f"⚠️ **Atención Media Dieta:** El trayecto ({dist:.1f} km) supera los 40km.")
                 if st.session_state.calculation_results['aviso_jornada']: st.warning(f"⏰ **Aviso Jornada:** El trayecto ({mins} min) supera los 60 minutos.")
-                st.metric(f"TRAYECTO MÁS LARGO ({dist:.1f} km)", f"{_cargo(mins)} min a cargo", f"Tiempo total: {mins} min", delta_color="off")
-                total_final = _cargo(mins) * 2
+                st.metric(f"TRAYECTO MÁS LARGO ({dist:.1f} km)", f"{int(evaluacion['total_minutos']) // 2} min a cargo", f"Tiempo total: {mins} min", delta_color="off")
             else:
-                st.session_state.calculation_results.update({'aviso_pernocta': res['min_ida'] > 80 or res['min_vuelta'] > 80, 'aviso_dieta': res['dist_ida'] > 40 or res['dist_vuelta'] > 40, 'aviso_jornada': res['min_ida'] > 60 or res['min_vuelta'] > 60})
                 if st.session_state.calculation_results['aviso_pernocta']: st.warning("🛌 **Aviso Pernocta:** Uno o ambos trayectos superan los 80 minutos.")
                 if st.session_state.calculation_results['aviso_dieta']: st.warning("⚠️ **Atención Media Dieta:** Uno o ambos trayectos superan los 40km.")
                 if st.session_state.calculation_results['aviso_jornada']: st.warning("⏰ **Aviso Jornada:** Uno o ambos trayectos superan los 60 minutos.")
-                st.metric(f"IDA: {res['dist_ida']:.1f} km", f"{_cargo(res['min_ida'])} min a cargo", f"Tiempo total: {res['min_ida']} min", delta_color="off")
-                st.metric(f"VUELTA: {res['dist_vuelta']:.1f} km", f"{_cargo(res['min_vuelta'])} min a cargo", f"Tiempo total: {res['min_vuelta']} min", delta_color="off")
-                total_final = _cargo(res['min_ida']) + _cargo(res['min_vuelta'])
+                st.metric(f"IDA: {res['dist_ida']:.1f} km", f"{evaluacion['cargo_ida']} min a cargo", f"Tiempo total: {res['min_ida']} min", delta_color="off")
+                st.metric(f"VUELTA: {res['dist_vuelta']:.1f} km", f"{evaluacion['cargo_vuelta']} min a cargo", f"Tiempo total: {res['min_vuelta']} min", delta_color="off")
+            total_final = int(evaluacion['total_minutos'])
             st.markdown("---")
             st.success(f"**Tiempo total a restar de la jornada:** {total_final} minutos")
             mostrar_horas_de_salida(total_final)
@@ -294,30 +301,28 @@ def full_calculator_app():
             if st.button("📧 Enviar mail al equipo", key="btn_gmaps_mail"): st.session_state.page = 'email_form'; st.rerun()
 
 # --- PÁGINA DE EMAIL ---
+@metricas.medido('email')
 def email_form_app():
     st.title("📧 Redactar y Enviar Notificación")
     if st.button("⬅️ Volver a la calculadora"): st.session_state.page = 'calculator'; st.rerun()
     st.markdown("---")
-    employees_df = cargar_datos_empleados()
-    if employees_df is None: return
+    datos_empleados = cargar_datos_empleados()
+    if datos_empleados is None: return
+    directorio = datos_empleados.derivados['directorio']
     st.header("1. Filtrar y Seleccionar Destinatarios")
     col1, col2 = st.columns(2)
-    with col1: provincia_sel = st.selectbox("Filtrar por Provincia:", employees_df['PROVINCIA'].unique())
-    with col2:
-        equipos_en_provincia = employees_df[employees_df['PROVINCIA'] == provincia_sel]['EQUIPO'].unique()
-        equipo_sel = st.selectbox("Filtrar por Equipo:", equipos_en_provincia)
-    personas_en_provincia = employees_df[employees_df['PROVINCIA'] == provincia_sel]
-    personas_en_equipo = personas_en_provincia[personas_en_provincia['EQUIPO'] == equipo_sel]
-    nombres_seleccionados = st.multiselect("Destinatarios:", options=personas_en_provincia['NOMBRE COMPLETO'].tolist(), default=personas_en_equipo['NOMBRE COMPLETO'].tolist())
+    with col1: provincia_sel = st.selectbox("Filtrar por Provincia:", directorio.provincias)
+    with col2: equipo_sel = st.selectbox("Filtrar por Equipo:", directorio.equipos_de(provincia_sel))
+    nombres_seleccionados = st.multiselect("Destinatarios:", options=directorio.personas_de(provincia_sel), default=directorio.miembros_de(provincia_sel, equipo_sel))
     if not nombres_seleccionados: st.info("Selecciona al menos un destinatario."); return
-    destinatarios_df = employees_df[employees_df['NOMBRE COMPLETO'].isin(nombres_seleccionados)]
+    destinatarios_df = directorio.destinatarios(nombres_seleccionados)
     def crear_saludo(nombres):
         if not nombres: return "Hola,"
         nombres_cortos = [name.split()[0] for name in nombres]
         return f"Hola {nombres_cortos[0]}," if len(nombres_cortos) == 1 else f"Hola {', '.join(nombres_cortos[:-1])} y {nombres_cortos[-1]},"
     saludo = crear_saludo(nombres_seleccionados)
     with st.expander("Confirmar destinatarios y correos", expanded=True):
-        if not destinatarios_df.empty: st.markdown("\n".join([f"- **{row['NOMBRE COMPLETO']}** ({row['EMAIL']})" for _, row in destinatarios_df.iterrows()]))
+        if not destinatarios_df.empty: st.markdown(directorio.lista_markdown(destinatarios_df))
         else: st.write("No hay destinatarios.")
     tipo_mail = st.radio("Tipo de notificación:", ["Comunicar Horario de Salida", "Notificar Tipo de Jornada", "Informar de Pernocta"], horizontal=True)
     st.header("2. Revisa y Edita el Correo")
@@ -336,22 +341,63 @@ def email_form_app():
     cuerpo = st.text_area("Cuerpo del Mensaje:", cuerpo_pred, height=300)
     st.markdown("---")
     
-    st.button("🚀 Enviar Email", type="primary", disabled=True, help="La función de envío está desactivada temporalmente.")
+    envio_activo = smtp_habilitado()
+    if st.button("🚀 Enviar Email", type="primary", disabled=not envio_activo, help=None if envio_activo else "La función de envío está desactivada temporalmente."):
+        ids = send_email(destinatarios_df['EMAIL'].tolist(), asunto, cuerpo)
+        if ids: st.session_state.envios = st.session_state.get('envios', []) + ids; st.success("📨 Correo en cola de envío.")
+    if st.session_state.get('envios'):
+        st.subheader("Estado de los envíos")
+        iconos = {correo.PENDIENTE: "⏳ Pendiente", correo.ENVIANDO: "📤 Enviando", correo.ENVIADO: "✅ Enviado", correo.FALLIDO: "❌ Fallido"}
+        cola = obtener_cola_correo()
+        if cola.ultimo_error: st.warning(f"⚠️ La cola de envío no puede acceder a la bandeja de salida ({cola.ultimo_error}); se reintenta automáticamente.")
+        estados = pd.DataFrame(cola.estado(st.session_state.envios))
+        if not estados.empty:
+            estados['estado'] = estados['estado'].map(iconos)
+            estados['actualizado'] = pd.to_datetime(estados['actualizado'], unit='s', utc=True).dt.tz_convert('Europe/Madrid').dt.strftime('%H:%M:%S')
+            st.dataframe(estados, hide_index=True)
+        st.button("🔄 Actualizar estado")
+
+def smtp_habilitado():
+    try: return bool(st.secrets["smtp"].get("enabled", False))
+    except Exception: return False
+
+@st.cache_resource
+def obtener_cola_correo():
+    smtp_cfg = dict(st.secrets["smtp"])
+    return correo.ColaCorreo(smtp_cfg, smtp_cfg.get("outbox", "bandeja_salida.sqlite"))
 
 def send_email(recipients, subject, body):
-    try:
-        smtp_cfg = st.secrets["smtp"]
-        sender, password = smtp_cfg["username"], smtp_cfg["password"]
-        msg = MIMEMultipart()
-        msg['From'], msg['To'], msg['Subject'] = sender, ", ".join(recipients), subject
-        msg.attach(MIMEText(body, 'plain'))
-        server = smtplib.SMTP(smtp_cfg["server"], smtp_cfg["port"])
-        server.starttls(); server.login(sender, password); server.send_message(msg); server.quit()
-        return True
-    except Exception as e: st.error(f"Error técnico: {e}"); return False
+    try: return obtener_cola_correo().encolar(recipients, subject, body)
+    except Exception as e: st.error(f"Error técnico: {e}"); return []
+
+# --- PANEL DE MÉTRICAS (oculto: ?panel=metricas, solo usuarios en admin_users) ---
+def es_admin():
+    try: return st.session_state.get('username') in list(st.secrets.get("admin_users", []))
+    except Exception: return False
+
+def metricas_admin_app():
+    st.title("📈 Métricas por etapa")
+    if not metricas.ACTIVAS: st.info("La instrumentación está desactivada. Arranca la aplicación con DIGI_METRICAS=1."); return
+    recientes = metricas.REGISTRO.recientes()
+    if not recientes: st.info("Aún no hay medidas."); return
+    resumen = pd.DataFrame([{'etapa': etapa, 'n': len(ms), **dict(zip(['p50 ms', 'p95 ms', 'p99 ms'], np.percentile(ms, [50, 95, 99]) * 1000))}
+                            for etapa, ms in sorted(recientes.items())])
+    st.dataframe(resumen.round(2), hide_index=True)
+    etapa = st.selectbox("Histograma de la etapa:", resumen['etapa'])
+    cuentas, bordes = np.histogram(np.array(recientes[etapa]) * 1000, bins=20)
+    st.bar_chart(pd.DataFrame({'medidas': cuentas}, index=[f"{b:.1f}" for b in bordes[:-1]]), x_label="ms", y_label="medidas")
+    if metricas.REGISTRO.contadores: st.dataframe(pd.Series(dict(metricas.REGISTRO.contadores), name='total').rename_axis('contador').reset_index(), hide_index=True)
+    with st.expander("Formato Prometheus"): st.code(metricas.REGISTRO.prometheus(), language="text")
 
 # --- CONTROLADOR PRINCIPAL ---
+metricas.iniciar_publicacion()
+# La cola arranca con el proceso, antes del login, para reanudar los envíos pendientes tras un
+# reinicio aunque nadie inicie sesión; un fallo aquí no bloquea la pantalla de acceso.
+if smtp_habilitado():
+    try: obtener_cola_correo()
+    except Exception: pass
 if check_login():
-    if st.session_state.page == 'calculator': full_calculator_app()
+    if st.query_params.get('panel') == 'metricas' and es_admin(): metricas_admin_app()
+    elif st.session_state.page == 'calculator': full_calculator_app()
     elif st.session_state.page == 'email_form': email_form_app()
 
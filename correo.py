@@ -0,0 +1,161 @@
+# correo.py
+# Cola de envío de correo en segundo plano: bandeja de salida persistente (SQLite),
+# conexión SMTP autenticada reutilizada entre mensajes, lotes de destinatarios y
+# reintentos con espera exponencial (los rechazos 5xx fallan sin reintentar).
+import smtplib
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS bandeja_salida (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    destinatarios TEXT NOT NULL,
+    asunto TEXT NOT NULL,
+    cuerpo TEXT NOT NULL,
+    estado TEXT NOT NULL DEFAULT 'pendiente',
+    intentos INTEGER NOT NULL DEFAULT 0,
+    siguiente_intento REAL NOT NULL,
+    ultimo_error TEXT,
+    propietario TEXT,
+    creado REAL NOT NULL,
+    actualizado REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS bandeja_salida_pendientes ON bandeja_salida (estado, siguiente_intento);
+"""
+
+PENDIENTE, ENVIANDO, ENVIADO, FALLIDO = 'pendiente', 'enviando', 'enviado', 'fallido'
+
+
+def _es_permanente(error):
+    # Un 5xx del servidor para este mensaje (buzón inexistente, contenido rechazado...) no cambia al
+    # reintentar. Los 4xx, los cortes de conexión y los fallos al conectar o autenticarse sí se reintentan.
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return bool(error.recipients) and all(codigo >= 500 for codigo, _ in error.recipients.values())
+    if isinstance(error, (smtplib.SMTPConnectError, smtplib.SMTPAuthenticationError)): return False
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+
+
+class ColaCorreo:
+    def __init__(self, config, ruta_bandeja="bandeja_salida.sqlite", max_destinatarios=50, max_intentos=5,
+                 espera_base=5.0, intervalo_sondeo=2.0, bloqueo_maximo=300.0, timeout=30):
+        self.config, self.ruta_bandeja = dict(config), ruta_bandeja
+        self.max_destinatarios, self.max_intentos, self.espera_base = max_destinatarios, max_intentos, espera_base
+        self.intervalo_sondeo, self.bloqueo_maximo, self.timeout = intervalo_sondeo, bloqueo_maximo, timeout
+        self._id = uuid.uuid4().hex  # identifica a este proceso al reclamar mensajes de la bandeja compartida
+        self._smtp, self._despertar, self._parar = None, threading.Event(), threading.Event()
+        self.ultimo_error = None  # último fallo del propio trabajador (bandeja), no de un envío
+        with self._bd() as con: con.executescript(ESQUEMA)
+        self._hilo = threading.Thread(target=self._bucle, name="cola-correo", daemon=True)
+        self._hilo.start()
+
+    def _abrir(self):
+        con = sqlite3.connect(self.ruta_bandeja, timeout=10)
+        con.execute("PRAGMA journal_mode=WAL")
+        return con
+
+    @contextmanager
+    def _bd(self):
+        con = self._abrir()
+        try:
+            with con: yield con
+        finally: con.close()
+
+    # --- API PARA LA APLICACIÓN ---
+    def encolar(self, destinatarios, asunto, cuerpo):
+        ahora, ids = time.time(), []
+        with self._bd() as con:
+            for i in range(0, len(destinatarios), self.max_destinatarios):
+                lote = destinatarios[i:i + self.max_destinatarios]
+                cur = con.execute("INSERT INTO bandeja_salida (destinatarios, asunto, cuerpo, siguiente_intento, creado, actualizado) VALUES (?, ?, ?, ?, ?, ?)",
+                                  (", ".join(lote), asunto, cuerpo, ahora, ahora, ahora))
+                ids.append(cur.lastrowid)
+        self._despertar.set()
+        return ids
+
+    def estado(self, ids):
+        if not ids: return []
+        with self._bd() as con:
+            filas = con.execute(f"SELECT id, destinatarios, estado, intentos, ultimo_error, actualizado FROM bandeja_salida WHERE id IN ({','.join('?' * len(ids))}) ORDER BY id", list(ids)).fetchall()
+        return [dict(zip(['id', 'destinatarios', 'estado', 'intentos', 'ultimo_error', 'actualizado'], fila)) for fila in filas]
+
+    def detener(self):
+        self._parar.set(); self._despertar.set(); self._hilo.join()
+
+    # --- TRABAJADOR ---
+    def _reclamar(self, con):
+        ahora = time.time()
+        with con:
+            # Mensajes que otro proceso dejó a medias (caída o reinicio) vuelven a la cola.
+            con.execute("UPDATE bandeja_salida SET estado = ?, propietario = NULL WHERE estado = ? AND actualizado < ?", (PENDIENTE, ENVIANDO, ahora - self.bloqueo_maximo))
+            fila = con.execute("SELECT id FROM bandeja_salida WHERE estado = ? AND siguiente_intento <= ? ORDER BY siguiente_intento LIMIT 1", (PENDIENTE, ahora)).fetchone()
+            if fila is None: return None
+            reclamado = con.execute("UPDATE bandeja_salida SET estado = ?, propietario = ?, actualizado = ? WHERE id = ? AND estado = ?",
+                                    (ENVIANDO, self._id, ahora, fila[0], PENDIENTE)).rowcount
+        if not reclamado: return None
+        return con.execute("SELECT id, destinatarios, asunto, cuerpo, intentos FROM bandeja_salida WHERE id = ?", (fila[0],)).fetchone()
+
+    def _conexion(self):
+        if self._smtp is not None:
+            try:
+                if self._smtp.noop()[0] == 250: return self._smtp
+            except (smtplib.SMTPException, OSError): pass
+            self._cerrar()
+        cfg = self.config
+        smtp = smtplib.SMTP(cfg["server"], int(cfg["port"]), timeout=self.timeout)
+        try:
+            if cfg.get("starttls", True): smtp.starttls()
+            if cfg.get("password"): smtp.login(cfg["username"], cfg["password"])
+        except BaseException:
+            smtp.close()
+            raise
+        self._smtp = smtp
+        return smtp
+
+    def _cerrar(self):
+        try: self._smtp.quit()
+        except Exception: pass
+        self._smtp = None
+
+    def _enviar(self, destinatarios, asunto, cuerpo):
+        sender = self.config["username"]
+        msg = MIMEMultipart()
+        msg['From'], msg['To'], msg['Subject'] = sender, destinatarios, asunto
+        msg.attach(MIMEText(cuerpo, 'plain'))
+        self._conexion().send_message(msg)
+
+    def _bucle(self):
+        con = self._abrir()
+        while not self._parar.is_set():
+            # Un fallo de la bandeja (p. ej. 'database is locked') no puede matar el hilo: se anota y se reintenta.
+            try:
+                self._procesar(con)
+            except Exception as e:
+                self.ultimo_error = f"{type(e).__name__}: {e}"
+                self._parar.wait(self.intervalo_sondeo)
+        if self._smtp is not None: self._cerrar()
+        con.close()
+
+    def _procesar(self, con):
+        mensaje = self._reclamar(con)
+        self.ultimo_error = None
+        if mensaje is None:
+            self._despertar.wait(self.intervalo_sondeo); self._despertar.clear()
+            return
+        id_, destinatarios, asunto, cuerpo, intentos = mensaje
+        try:
+            self._enviar(destinatarios, asunto, cuerpo)
+            estado, error, siguiente = ENVIADO, None, time.time()
+        except Exception as e:
+            self._cerrar()
+            intentos_hechos = intentos + 1
+            estado = FALLIDO if intentos_hechos >= self.max_intentos or _es_permanente(e) else PENDIENTE
+            error, siguiente = f"{type(e).__name__}: {e}", time.time() + self.espera_base * 2 ** intentos
+        # Si esta escritura falla el mensaje queda 'enviando' y vuelve a la cola pasado bloqueo_maximo.
+        with con:
+            con.execute("UPDATE bandeja_salida SET estado = ?, intentos = intentos + 1, ultimo_error = ?, siguiente_intento = ?, propietario = NULL, actualizado = ? WHERE id = ?",
+                        (estado, error, siguiente, time.time(), id_))
@@ -0,0 +1,64 @@
+# empleados.py
+# Lectura de employees.csv y directorio indexado (provincia -> equipos -> personas,
+# nombre -> correo) para que el formulario de email no filtre el DataFrame en cada rerun.
+import pandas as pd
+
+import metricas
+
+REQUIRED_COLS = ['PROVINCIA', 'EQUIPO', 'NOMBRE COMPLETO', 'EMAIL', 'PERSONAL']
+
+
+class ColumnasFaltantes(ValueError):
+    pass
+
+
+@metricas.medido('carga.empleados')
+def leer_empleados(filename="employees.csv", version=None):
+    df = pd.read_csv(filename, delimiter='|', encoding='latin-1')
+    if not all(col in df.columns for col in REQUIRED_COLS):
+        missing_cols = [col for col in REQUIRED_COLS if col not in df.columns]
+        raise ColumnasFaltantes(f"Faltan las siguientes columnas obligatorias: {missing_cols}")
+    df = df.dropna(subset=REQUIRED_COLS)
+    for col in REQUIRED_COLS:
+        if isinstance(df[col].iloc[0], str):
+            df[col] = df[col].str.strip()
+    df = df[df['PERSONAL'].str.lower() == 'activo'].copy()
+    df.attrs['version'] = version
+    return df
+
+
+class DirectorioEmpleados:
+    __slots__ = ('version', 'provincias', '_equipos', '_miembros', '_personas', '_filas_por_nombre', '_nombres', '_emails')
+
+    def __init__(self, df, version=None):
+        self.version = version
+        self._nombres = df['NOMBRE COMPLETO'].to_numpy(dtype=object)
+        self._emails = df['EMAIL'].to_numpy(dtype=object)
+        equipos, miembros, personas, self._filas_por_nombre = {}, {}, {}, {}
+        # Se respeta el orden de aparición en el fichero, como hacía unique().
+        for fila, (provincia, equipo, nombre) in enumerate(zip(df['PROVINCIA'].tolist(), df['EQUIPO'].tolist(), self._nombres)):
+            equipos.setdefault(provincia, {})[equipo] = None
+            miembros.setdefault((provincia, equipo), []).append(nombre)
+            personas.setdefault(provincia, []).append(nombre)
+            self._filas_por_nombre.setdefault(nombre, []).append(fila)
+        self.provincias = list(equipos)
+        self._equipos = {provincia: list(nombres) for provincia, nombres in equipos.items()}
+        self._miembros, self._personas = miembros, personas
+
+    def equipos_de(self, provincia):
+        return self._equipos.get(provincia, [])
+
+    def personas_de(self, provincia):
+        return self._personas.get(provincia, [])
+
+    def miembros_de(self, provincia, equipo):
+        return self._miembros.get((provincia, equipo), [])
+
+    def destinatarios(self, nombres):
+        # Filas de todas las personas con esos nombres, en el orden del fichero.
+        filas = sorted(fila for nombre in set(nombres) for fila in self._filas_por_nombre.get(nombre, []))
+        return pd.DataFrame({'NOMBRE COMPLETO': self._nombres[filas], 'EMAIL': self._emails[filas]})
+
+    @staticmethod
+    def lista_markdown(destinatarios):
+        return ("- **" + destinatarios['NOMBRE COMPLETO'].astype(str) + "** (" + destinatarios['EMAIL'].astype(str) + ")").str.cat(sep="\n")
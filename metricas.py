@@ -0,0 +1,159 @@
+# metricas.py
+# Instrumentación opcional de los caminos calientes: tiempos por etapa, contadores de
+# caché y latencia de llamadas externas. Se activa con DIGI_METRICAS=1; desactivada,
+# medir() devuelve un contexto vacío compartido y medido() deja la función intacta.
+#
+#   DIGI_METRICAS=1              activa la recogida
+#   DIGI_METRICAS_PUERTO=9108    expone /metrics en formato de texto de Prometheus
+#   DIGI_METRICAS_HOST=127.0.0.1 interfaz de escucha; /metrics no tiene autenticación, por
+#                                defecto solo es accesible desde la propia máquina
+#   DIGI_METRICAS_LOG=ruta.log   registra cada medida en un log rotativo (JSON por línea)
+import bisect
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging.handlers import RotatingFileHandler
+
+ACTIVAS = os.environ.get('DIGI_METRICAS', '').lower() in ('1', 'true', 'si', 'sí')
+LIMITES_SEG = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MUESTRAS_RECIENTES = 1000
+
+
+class _Etapa:
+    __slots__ = ('cubetas', 'suma', 'cuenta', 'recientes')
+
+    def __init__(self):
+        self.cubetas, self.suma, self.cuenta = [0] * (len(LIMITES_SEG) + 1), 0.0, 0
+        self.recientes = deque(maxlen=MUESTRAS_RECIENTES)
+
+
+class Registro:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.etapas, self.contadores = defaultdict(_Etapa), defaultdict(int)
+        self.log = None
+
+    def observar(self, etapa, segundos):
+        with self._lock:
+            e = self.etapas[etapa]
+            e.cubetas[bisect.bisect_left(LIMITES_SEG, segundos)] += 1
+            e.suma += segundos; e.cuenta += 1
+            e.recientes.append(segundos)
+        if self.log: self.log.info(json.dumps({'t': round(time.time(), 3), 'etapa': etapa, 'ms': round(segundos * 1000, 3)}))
+
+    def contar(self, nombre, n=1):
+        with self._lock: self.contadores[nombre] += n
+
+    def recientes(self):
+        with self._lock: return {etapa: list(e.recientes) for etapa, e in self.etapas.items()}
+
+    def prometheus(self):
+        lineas = []
+        with self._lock:
+            if self.etapas:
+                lineas += ["# HELP digi_etapa_segundos Duración de cada etapa instrumentada.", "# TYPE digi_etapa_segundos histogram"]
+            for etapa, e in sorted(self.etapas.items()):
+                acumulado = 0
+                for limite, n in zip(LIMITES_SEG + (float('inf'),), e.cubetas):
+                    acumulado += n
+                    le = '+Inf' if limite == float('inf') else repr(limite)
+                    lineas.append(f'digi_etapa_segundos_bucket{{etapa="{etapa}",le="{le}"}} {acumulado}')
+                lineas += [f'digi_etapa_segundos_sum{{etapa="{etapa}"}} {e.suma}', f'digi_etapa_segundos_count{{etapa="{etapa}"}} {e.cuenta}']
+            if self.contadores:
+                lineas += ["# HELP digi_eventos_total Contadores de caché y de llamadas.", "# TYPE digi_eventos_total counter"]
+            lineas += [f'digi_eventos_total{{nombre="{nombre}"}} {n}' for nombre, n in sorted(self.contadores.items())]
+        return "\n".join(lineas) + "\n"
+
+
+REGISTRO = Registro()
+
+
+# --- API DE INSTRUMENTACIÓN ---
+class _Medicion:
+    __slots__ = ('etapa', 'inicio')
+
+    def __init__(self, etapa):
+        self.etapa = etapa
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        REGISTRO.observar(self.etapa, time.perf_counter() - self.inicio)
+        return False
+
+
+class _Nula:
+    __slots__ = ()
+    def __enter__(self): return self
+    def __exit__(self, *exc): return False
+
+
+_NULA = _Nula()
+
+
+def medir(etapa):
+    return _Medicion(etapa) if ACTIVAS else _NULA
+
+
+def medido(etapa):
+    def decorador(funcion):
+        if not ACTIVAS: return funcion
+
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            with _Medicion(etapa): return funcion(*args, **kwargs)
+        return envoltura
+    return decorador
+
+
+def contar(nombre, n=1):
+    if ACTIVAS: REGISTRO.contar(nombre, n)
+
+
+# --- PUBLICACIÓN ---
+class _Manejador(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404); return
+        cuerpo = REGISTRO.prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, *args):
+        pass
+
+
+_iniciado = threading.Lock()
+_publicacion = {}
+
+
+def iniciar_publicacion():
+    # Idempotente: Streamlit reejecuta el script en cada interacción.
+    if not ACTIVAS: return
+    with _iniciado:
+        puerto = os.environ.get('DIGI_METRICAS_PUERTO')
+        if puerto and 'servidor' not in _publicacion:
+            try:
+                servidor = ThreadingHTTPServer((os.environ.get('DIGI_METRICAS_HOST', '127.0.0.1'), int(puerto)), _Manejador)
+            except OSError:
+                servidor = None  # otro proceso ya escucha en ese puerto
+            if servidor:
+                threading.Thread(target=servidor.serve_forever, name='metricas-http', daemon=True).start()
+            _publicacion['servidor'] = servidor
+        ruta_log = os.environ.get('DIGI_METRICAS_LOG')
+        if ruta_log and REGISTRO.log is None:
+            log = logging.getLogger('digi.metricas')
+            log.propagate = False
+            log.setLevel(logging.INFO)
+            log.addHandler(RotatingFileHandler(ruta_log, maxBytes=5 * 2 ** 20, backupCount=5, encoding='utf-8'))
+            REGISTRO.log = log
@@ -0,0 +1,82 @@
+# motor_calculo.py
+# Reglas de negocio del cálculo de desplazamientos, sin dependencias de Streamlit.
+# Todas las funciones aceptan escalares o arrays (NumPy/pandas) y operan vectorizadas,
+# de modo que una provincia entera o un mes de planificación se evalúa en una sola pasada.
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+
+# --- REGLAS ---
+MINUTOS_FRANQUICIA = 30  # los primeros 30 minutos de cada trayecto corren a cargo del trabajador
+UMBRAL_PERNOCTA_MIN = 80
+UMBRAL_DIETA_KM = 40
+UMBRAL_JORNADA_MIN = 60
+
+# Hora de salida habitual de cada horario; los viernes se sale una hora antes.
+HORARIOS_BASE = {"Verano": dt.time(15, 0), "Habitual Intensivo": dt.time(16, 0), "Normal": dt.time(17, 0)}
+ADELANTO_VIERNES_MIN = 60
+MINUTOS_DIA = 24 * 60
+_HH_MM = np.array([f"{m // 60:02d}:{m % 60:02d}" for m in range(MINUTOS_DIA)], dtype=object)
+
+DIAS_ES = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo"]
+MESES_ES = ["enero", "febrero", "marzo", "abril", "mayo", "junio", "julio", "agosto", "septiembre", "octubre", "noviembre", "diciembre"]
+
+
+def minutos_a_cargo(minutos):
+    return np.maximum(0, np.asarray(minutos) - MINUTOS_FRANQUICIA)
+
+
+def _normalizar(texto):
+    return np.char.lower(np.char.strip(np.asarray(texto, dtype=str)))
+
+
+def es_trayecto_identico(origen_ida, destino_ida, origen_vuelta, destino_vuelta):
+    identico = (_normalizar(origen_ida) == _normalizar(destino_vuelta)) & (_normalizar(destino_ida) == _normalizar(origen_vuelta))
+    return bool(identico) if identico.ndim == 0 else identico
+
+
+# --- TRAYECTOS ---
+def evaluar_trayectos(dist_ida, min_ida, dist_vuelta, min_vuelta, cargo_ida=None, cargo_vuelta=None, identico=False):
+    dist_ida, dist_vuelta = np.atleast_1d(np.asarray(dist_ida, dtype=float)), np.atleast_1d(np.asarray(dist_vuelta, dtype=float))
+    min_ida, min_vuelta = np.atleast_1d(np.asarray(min_ida, dtype=int)), np.atleast_1d(np.asarray(min_vuelta, dtype=int))
+    # La tabla oficial trae su propio tiempo a cargo; si no se da, se aplica la franquicia.
+    cargo_ida = minutos_a_cargo(min_ida) if cargo_ida is None else np.atleast_1d(np.asarray(cargo_ida, dtype=int))
+    cargo_vuelta = minutos_a_cargo(min_vuelta) if cargo_vuelta is None else np.atleast_1d(np.asarray(cargo_vuelta, dtype=int))
+    identico = np.broadcast_to(np.asarray(identico, dtype=bool), min_ida.shape)
+
+    # Ida y vuelta idénticas: cuenta dos veces el trayecto más largo.
+    ida_mas_larga = min_ida >= min_vuelta
+    dist_larga = np.where(ida_mas_larga, dist_ida, dist_vuelta)
+    min_larga = np.where(ida_mas_larga, min_ida, min_vuelta)
+    cargo_largo = np.where(ida_mas_larga, cargo_ida, cargo_vuelta)
+
+    return pd.DataFrame({
+        'distancia_ida': dist_ida, 'minutos_ida': min_ida, 'cargo_ida': cargo_ida,
+        'distancia_vuelta': dist_vuelta, 'minutos_vuelta': min_vuelta, 'cargo_vuelta': cargo_vuelta,
+        'identico': identico, 'distancia_larga': dist_larga, 'minutos_larga': min_larga,
+        'aviso_pernocta': np.where(identico, min_larga > UMBRAL_PERNOCTA_MIN, (min_ida > UMBRAL_PERNOCTA_MIN) | (min_vuelta > UMBRAL_PERNOCTA_MIN)),
+        'aviso_dieta': np.where(identico, dist_larga > UMBRAL_DIETA_KM, (dist_ida > UMBRAL_DIETA_KM) | (dist_vuelta > UMBRAL_DIETA_KM)),
+        'aviso_jornada': np.where(identico, min_larga > UMBRAL_JORNADA_MIN, (min_ida > UMBRAL_JORNADA_MIN) | (min_vuelta > UMBRAL_JORNADA_MIN)),
+        'total_minutos': np.where(identico, cargo_largo * 2, cargo_ida + cargo_vuelta),
+    })
+
+
+# --- HORAS DE SALIDA ---
+def horarios_base(fechas):
+    fechas = pd.DatetimeIndex(np.atleast_1d(pd.to_datetime(fechas))).normalize()
+    adelanto = pd.to_timedelta(np.where(fechas.dayofweek == 4, ADELANTO_VIERNES_MIN, 0), unit='m')
+    return pd.DataFrame({nombre: fechas + pd.Timedelta(hours=hora.hour, minutes=hora.minute) - adelanto for nombre, hora in HORARIOS_BASE.items()})
+
+
+def horas_de_salida(fechas, total_minutos):
+    fechas = pd.DatetimeIndex(np.atleast_1d(pd.to_datetime(fechas)))
+    adelanto = np.where(fechas.dayofweek == 4, ADELANTO_VIERNES_MIN, 0)
+    total = np.broadcast_to(np.asarray(total_minutos, dtype=int), adelanto.shape)
+    # Aritmética en minutos del día y formateo por tabla: evita strftime fila a fila.
+    return pd.DataFrame({nombre: _HH_MM[(hora.hour * 60 + hora.minute - adelanto - total) % MINUTOS_DIA] for nombre, hora in HORARIOS_BASE.items()})
+
+
+def formatear_fechas(fechas):
+    fechas = pd.DatetimeIndex(np.atleast_1d(pd.to_datetime(fechas)))
+    return [f"{DIAS_ES[d]} {dia} de {MESES_ES[m - 1]}" for d, dia, m in zip(fechas.dayofweek, fechas.day, fechas.month)]
@@ -0,0 +1,106 @@
+# planificador.py
+# Planificación de varios días: calcula en bloque las horas de salida y los avisos
+# de una lista de asignaciones (fecha, población de entrada, población de salida).
+import io
+
+import numpy as np
+import pandas as pd
+
+import buscador
+import motor_calculo
+
+COLUMNAS_ASIGNACION = ['fecha', 'entrada', 'salida']
+CODIFICACIONES = ('utf-8-sig', 'cp1252', 'latin-1')
+
+
+def leer_asignaciones(fichero):
+    # Acepta CSV separados por ';' o ',' (Excel en español exporta con ';'), en UTF-8 o en la
+    # página de códigos de Excel en español (cp1252); latin-1 lee cualquier byte y cierra la lista.
+    for codificacion in CODIFICACIONES:
+        if hasattr(fichero, 'seek'): fichero.seek(0)
+        try:
+            df = pd.read_csv(fichero, sep=None, engine='python', encoding=codificacion, dtype=str)
+            break
+        except UnicodeDecodeError:
+            continue
+    df.columns = [str(c).strip().lower() for c in df.columns]
+    faltan = [c for c in COLUMNAS_ASIGNACION if c not in df.columns]
+    if faltan: raise ValueError(f"Faltan las columnas obligatorias: {faltan}. Se esperan: {COLUMNAS_ASIGNACION} (y opcionalmente 'provincia').")
+    return df
+
+
+def _buscador(indice):
+    # Las celdas se comparan sin tildes ni mayúsculas: 'a pastoriza' y 'A PASTORIZA' son 'A Pastoriza'.
+    # Los nombres normalizados de cada provincia se preparan la primera vez que se consultan.
+    provincias, poblaciones = {}, {}
+    for provincia in indice.provincias: provincias.setdefault(buscador.normalizar(provincia), provincia)
+
+    def buscar(provincia, poblacion):
+        registro = indice.buscar(provincia, poblacion)
+        if registro is not None: return registro
+        provincia = provincias.get(buscador.normalizar(provincia))
+        if provincia is None: return None
+        if provincia not in poblaciones:
+            poblaciones[provincia] = {}
+            for nombre in indice.poblaciones_de(provincia): poblaciones[provincia].setdefault(buscador.normalizar(nombre), nombre)
+        nombre = poblaciones[provincia].get(buscador.normalizar(poblacion))
+        return None if nombre is None else indice.buscar(provincia, nombre)
+    return buscar
+
+
+def _registros(buscar, provincias, poblaciones):
+    # Una consulta al índice por combinación distinta, no por fila.
+    claves = pd.MultiIndex.from_arrays([provincias, poblaciones])
+    unicas = claves.unique()
+    tabla = [buscar(p, m) for p, m in unicas]
+    posiciones = unicas.get_indexer(claves)
+    encontrado = np.array([r is not None for r in tabla], dtype=bool)[posiciones]
+    def _campo(nombre, vacio):
+        return np.array([getattr(r, nombre) if r is not None else vacio for r in tabla], dtype=object)[posiciones]
+    return encontrado, {campo: _campo(campo, vacio) for campo, vacio in
+                        [('distancia', np.nan), ('minutos_total', 0), ('minutos_cargo', 0), ('centro_trabajo', '')]}
+
+
+def _fechas(valores):
+    # ISO (yyyy-mm-dd) primero y de forma estricta: con dayfirst, dateutil lee 2026-10-05 como 10 de mayo.
+    iso = pd.to_datetime(valores, format='ISO8601', errors='coerce')
+    resto = pd.to_datetime(valores.where(iso.isna()), format='mixed', dayfirst=True, errors='coerce')
+    return iso.fillna(resto)
+
+
+def planificar(asignaciones, indice, provincia=None):
+    df = asignaciones.copy()
+    for col in ['entrada', 'salida']: df[col] = df[col].astype(str).str.strip()
+    # Una celda de provincia vacía toma la provincia elegida en la pestaña.
+    provincias = df['provincia'].fillna('').astype(str).str.strip().replace('', provincia) if 'provincia' in df.columns else pd.Series(provincia, index=df.index)
+    fechas = _fechas(df['fecha'])
+
+    buscar = _buscador(indice)
+    ok_entrada, entrada = _registros(buscar, provincias, df['entrada'])
+    ok_salida, salida = _registros(buscar, provincias, df['salida'])
+    valido = ok_entrada & ok_salida & fechas.notna().to_numpy()
+
+    evaluacion = motor_calculo.evaluar_trayectos(entrada['distancia'].astype(float), entrada['minutos_total'].astype(int),
+                                                 salida['distancia'].astype(float), salida['minutos_total'].astype(int),
+                                                 entrada['minutos_cargo'].astype(int), salida['minutos_cargo'].astype(int))
+    salidas = motor_calculo.horas_de_salida(fechas.fillna(pd.Timestamp(0)), evaluacion['total_minutos'])
+
+    resultado = pd.DataFrame({
+        'fecha': fechas.dt.strftime('%d/%m/%Y').fillna(df['fecha'].astype(str)).to_numpy(), 'entrada': df['entrada'].to_numpy(), 'salida': df['salida'].to_numpy(),
+        'centro_entrada': entrada['centro_trabajo'], 'centro_salida': salida['centro_trabajo'],
+    })
+    calculado = pd.concat([evaluacion[['distancia_ida', 'minutos_ida', 'cargo_ida', 'distancia_vuelta', 'minutos_vuelta', 'cargo_vuelta',
+                                       'aviso_pernocta', 'aviso_dieta', 'aviso_jornada', 'total_minutos']], salidas], axis=1)
+    resultado = pd.concat([resultado, calculado.convert_dtypes().where(pd.Series(valido, index=calculado.index), axis=0)], axis=1)
+    # Se informan todos los errores de la fila, no solo el primero.
+    errores = zip(np.where(fechas.isna().to_numpy(), "Fecha no válida", ''),
+                  np.where(ok_entrada, '', "Población de entrada no encontrada en la tabla"),
+                  np.where(ok_salida, '', "Población de salida no encontrada en la tabla"))
+    resultado['error'] = ['; '.join(filter(None, fila)) for fila in errores]
+    return resultado
+
+
+def exportar_csv(resultado):
+    buffer = io.StringIO()
+    resultado.to_csv(buffer, sep=';', index=False, decimal=',')
+    return buffer.getvalue().encode('utf-8-sig')
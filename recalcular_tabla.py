@@ -0,0 +1,210 @@
+# recalcular_tabla.py
+# Recalcula offline toda la tabla oficial (tiempos.csv) con la regla de tope a 90 km/h,
+# con concurrencia acotada, límite de peticiones por segundo y reanudación desde checkpoint.
+#
+# Uso:
+#   python recalcular_tabla.py tiempos.csv tiempos_nuevo.csv --api-key ...
+#   python recalcular_tabla.py tiempos.csv tiempos_nuevo.csv --fixture rutas_grabadas.json   (sin red)
+#   python recalcular_tabla.py tiempos.csv tiempos_nuevo.csv --base-url http://localhost:8080  (servidor stub)
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import pandas as pd
+
+from cache_rutas import clave_ruta
+from motor_calculo import minutos_a_cargo
+from rutas import calcular_minutos_con_limite
+
+COL_CENTRO = 'Centro de Trabajo Nuevo'
+COL_DISTANCIA = 'Distancia en Kms'
+COL_HORAS = 'Tiempo(Horas)'
+COL_MINUTOS = 'Tiempo(Min)'
+COL_CARGO = 'Tiempo a cargo de empresa(Min)'
+DESTINO_POR_DEFECTO = '{Poblacion_IC}, {Provincia_WFI}'
+TAM_BLOQUE = 5000  # filas de tiempos.csv en memoria a la vez
+
+
+# --- CLIENTES DE DIRECTIONS PARA PRUEBAS ---
+class ClienteFixture:
+    """Reproduce respuestas grabadas ({clave_ruta: respuesta de directions}) sin salir a la red."""
+
+    def __init__(self, ruta):
+        with open(ruta, encoding='utf-8') as f:
+            self.respuestas = json.load(f)
+
+    def directions(self, origen, destino, mode="driving", avoid=None, **kwargs):
+        return self.respuestas.get(clave_ruta(origen, destino, mode, avoid), [])
+
+
+class ClienteGrabador:
+    """Envuelve un cliente real y guarda sus respuestas en un fichero reutilizable por ClienteFixture."""
+
+    def __init__(self, cliente, ruta):
+        self.cliente, self.ruta, self.respuestas, self._lock = cliente, ruta, {}, threading.Lock()
+        if os.path.exists(ruta):
+            with open(ruta, encoding='utf-8') as f: self.respuestas = json.load(f)
+
+    def directions(self, origen, destino, mode="driving", avoid=None, **kwargs):
+        respuesta = self.cliente.directions(origen, destino, mode=mode, avoid=avoid, **kwargs)
+        with self._lock: self.respuestas[clave_ruta(origen, destino, mode, avoid)] = respuesta
+        return respuesta
+
+    def guardar(self):
+        with self._lock, open(self.ruta, 'w', encoding='utf-8') as f:
+            json.dump(self.respuestas, f, ensure_ascii=False)
+
+
+class LimitadorTasa:
+    def __init__(self, por_segundo):
+        self.intervalo, self.siguiente, self._lock = (1 / por_segundo if por_segundo > 0 else 0), time.monotonic(), threading.Lock()
+
+    def esperar(self):
+        with self._lock:
+            ahora = time.monotonic()
+            espera, self.siguiente = self.siguiente - ahora, max(self.siguiente, ahora) + self.intervalo
+        if espera > 0: time.sleep(espera)
+
+
+# --- CHECKPOINT ---
+def leer_checkpoint(ruta):
+    hechos = {}
+    if os.path.exists(ruta):
+        with open(ruta, encoding='utf-8') as f:
+            for linea in f:
+                # Una última línea cortada por una interrupción se descarta y se vuelve a pedir.
+                try: registro = json.loads(linea)
+                except json.JSONDecodeError: continue
+                hechos[registro['clave']] = registro
+    return hechos
+
+
+# --- PROCESO ---
+def resolver_rutas(pares, cliente, ruta_checkpoint, concurrencia=4, por_segundo=10.0, progreso=None, hechos=None, limitador=None):
+    if hechos is None: hechos = leer_checkpoint(ruta_checkpoint)
+    # Las rutas que fallaron en una ejecución anterior se vuelven a intentar.
+    pendientes = [(clave, origen, destino) for clave, (origen, destino) in pares.items() if clave not in hechos or hechos[clave]['error']]
+    limitador = limitador or LimitadorTasa(por_segundo)
+
+    def _tarea(origen, destino):
+        limitador.esperar()
+        return calcular_minutos_con_limite(origen, destino, cliente)
+
+    with open(ruta_checkpoint, 'a', encoding='utf-8') as checkpoint, ThreadPoolExecutor(max_workers=concurrencia) as pool:
+        en_curso, cola, completadas = {}, iter(pendientes), 0
+        while True:
+            # Nunca hay más de 2 * concurrencia tareas encoladas en el pool.
+            for clave, origen, destino in cola:
+                en_curso[pool.submit(_tarea, origen, destino)] = clave
+                if len(en_curso) >= 2 * concurrencia: break
+            if not en_curso: break
+            terminados, _ = wait(en_curso, return_when=FIRST_COMPLETED)
+            for futuro in terminados:
+                clave = en_curso.pop(futuro)
+                distancia, minutos, error = futuro.result()
+                hechos[clave] = {'clave': clave, 'distancia': distancia, 'minutos': minutos, 'error': error}
+                checkpoint.write(json.dumps(hechos[clave], ensure_ascii=False) + '\n'); checkpoint.flush()
+                completadas += 1
+                if progreso: progreso(completadas, len(pendientes))
+    return hechos
+
+
+def _numero(texto):
+    return pd.to_numeric(pd.Series(texto, dtype=str).str.replace(',', '.', regex=False), errors='coerce')
+
+
+def _formatear(valores, decimales):
+    return [f"{v:.{decimales}f}".replace('.', ',') for v in valores]
+
+
+def recalcular_tabla(origen, salida, cliente, destino=DESTINO_POR_DEFECTO, concurrencia=4, por_segundo=10.0, limite=None, progreso=None, tam_bloque=TAM_BLOQUE):
+    # El CSV se lee por bloques: cada bloque se resuelve y se escribe antes de leer el siguiente.
+    ruta_checkpoint = salida + '.checkpoint.jsonl'
+    hechos, vistas, limitador = leer_checkpoint(ruta_checkpoint), set(), LimitadorTasa(por_segundo)
+    resumen = dict.fromkeys(('filas', 'rutas', 'errores', 'cambios_minutos', 'cambios_cargo'), 0)
+    bloques = pd.read_csv(origen, delimiter=';', encoding='latin-1', dtype=str, keep_default_na=False, chunksize=tam_bloque, nrows=limite)
+    with bloques, open(salida, 'w', encoding='latin-1', newline='') as tabla, \
+            open(salida + '.diferencias.csv', 'w', encoding='utf-8', newline='') as diferencias:
+        for n, df in enumerate(bloques):
+            origenes = df[COL_CENTRO].str.strip().tolist()
+            destinos = [destino.format_map(fila) for fila in df.to_dict('records')]
+            claves = [clave_ruta(o, d) for o, d in zip(origenes, destinos)]
+            # Una ruta repetida en varios bloques se pide una sola vez por ejecución.
+            pares = {clave: par for clave, par in zip(claves, zip(origenes, destinos)) if clave not in vistas}
+            vistas.update(pares)
+            resolver_rutas(pares, cliente, ruta_checkpoint, concurrencia, por_segundo, progreso, hechos, limitador)
+
+            resultados = pd.DataFrame([hechos[c] for c in claves], index=df.index)
+            ok = resultados['error'].isna() & resultados['minutos'].notna()
+            distancia = resultados.loc[ok, 'distancia'].astype(float)
+            minutos = resultados.loc[ok, 'minutos'].astype(int)
+
+            nuevo = df.copy()
+            nuevo.loc[ok, COL_DISTANCIA] = _formatear(distancia, 2)
+            nuevo.loc[ok, COL_HORAS] = _formatear(minutos / 60, 2)
+            nuevo.loc[ok, COL_MINUTOS] = minutos.astype(str)
+            nuevo.loc[ok, COL_CARGO] = minutos_a_cargo(minutos).astype(str)
+            nuevo.to_csv(tabla, sep=';', index=False, header=n == 0, lineterminator='\r\n')
+
+            # --- INFORME DE DIFERENCIAS ---
+            informe = pd.DataFrame({
+                'fila': df.index + 2,  # línea del CSV (cabecera incluida); el índice sigue entre bloques
+                'poblacion': df['Poblacion_IC'], 'centro_trabajo': origenes,
+                'distancia_anterior': _numero(df[COL_DISTANCIA]).values, 'distancia_nueva': _numero(nuevo[COL_DISTANCIA]).values,
+                'minutos_anterior': _numero(df[COL_MINUTOS]).values, 'minutos_nuevo': _numero(nuevo[COL_MINUTOS]).values,
+                'cargo_anterior': _numero(df[COL_CARGO]).values, 'cargo_nuevo': _numero(nuevo[COL_CARGO]).values,
+                'error': resultados['error'].values,
+            })
+            informe['delta_minutos'] = informe['minutos_nuevo'] - informe['minutos_anterior']
+            informe['delta_cargo'] = informe['cargo_nuevo'] - informe['cargo_anterior']
+            cambios = informe[(informe['delta_minutos'] != 0) | (informe['distancia_nueva'] != informe['distancia_anterior']) | informe['error'].notna()]
+            cambios.to_csv(diferencias, sep=';', index=False, header=n == 0, decimal=',')
+
+            resumen['filas'] += len(df)
+            resumen['errores'] += int((~ok).sum())
+            resumen['cambios_minutos'] += int((informe['delta_minutos'] != 0).sum())
+            resumen['cambios_cargo'] += int((informe['delta_cargo'] != 0).sum())
+    resumen['rutas'] = len(vistas)
+    return resumen
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recalcula tiempos.csv con el método DIGI (tope a 90 km/h por tramo).")
+    parser.add_argument('origen'); parser.add_argument('salida')
+    parser.add_argument('--api-key', default=os.environ.get('GOOGLE_API_KEY'))
+    parser.add_argument('--base-url', help="URL de un servidor Directions alternativo (stub local).")
+    parser.add_argument('--fixture', help="Fichero JSON de respuestas grabadas; no se usa la red.")
+    parser.add_argument('--grabar', help="Guarda las respuestas reales en este fichero para reproducirlas después.")
+    parser.add_argument('--destino', default=DESTINO_POR_DEFECTO, help="Plantilla del destino con nombres de columna del CSV.")
+    parser.add_argument('--concurrencia', type=int, default=4)
+    parser.add_argument('--por-segundo', type=float, default=10.0)
+    parser.add_argument('--limite', type=int, help="Procesa solo las primeras N filas.")
+    parser.add_argument('--tam-bloque', type=int, default=TAM_BLOQUE, help="Filas del CSV que se leen y resuelven de cada vez.")
+    args = parser.parse_args(argv)
+
+    if args.fixture:
+        cliente = ClienteFixture(args.fixture)
+    else:
+        import googlemaps
+        opciones = {'base_url': args.base_url} if args.base_url else {}
+        cliente = googlemaps.Client(key=args.api_key, **opciones)
+        if args.grabar: cliente = ClienteGrabador(cliente, args.grabar)
+
+    def _progreso(completadas, pendientes):
+        if completadas % 100 == 0 or completadas == pendientes: print(f"  {completadas}/{pendientes} rutas pendientes", file=sys.stderr)
+
+    try:
+        resumen = recalcular_tabla(args.origen, args.salida, cliente, args.destino, args.concurrencia, args.por_segundo, args.limite, _progreso, args.tam_bloque)
+    finally:
+        if isinstance(cliente, ClienteGrabador): cliente.guardar()
+    print(f"Filas: {resumen['filas']} | Rutas distintas: {resumen['rutas']} | Errores: {resumen['errores']} | "
+          f"Cambian minutos: {resumen['cambios_minutos']} | Cambia tiempo a cargo: {resumen['cambios_cargo']}")
+    print(f"Tabla nueva: {args.salida} | Diferencias: {args.salida}.diferencias.csv")
+
+
+if __name__ == '__main__':
+    main()
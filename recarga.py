@@ -0,0 +1,79 @@
+# recarga.py
+# Recarga en caliente de ficheros de datos. Cada fichero se vigila en segundo plano por
+# mtime/tamaño y hash de contenido; al cambiar se carga la nueva versión y sus índices
+# derivados en ese mismo hilo y se sustituye de forma atómica para todas las sesiones.
+# Los derivados diferidos (caros y no imprescindibles para servir) se construyen en otro
+# hilo y se añaden a la versión cuando están listos; hasta entonces no aparecen en derivados.
+import hashlib
+import os
+import threading
+from collections import namedtuple
+
+Version = namedtuple('Version', ['version', 'datos', 'derivados'])
+
+
+def huella_archivo(ruta):
+    estado = os.stat(ruta)
+    return estado.st_mtime_ns, estado.st_size
+
+
+def hash_archivo(ruta):
+    h = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(1 << 20), b''):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+class DatosVivos:
+    def __init__(self, ruta, cargador, derivados=None, diferidos=None, intervalo=5.0):
+        self.ruta, self.cargador, self.intervalo = ruta, cargador, intervalo
+        self.constructores, self.diferidos = dict(derivados or {}), dict(diferidos or {})
+        self.ultimo_error = None
+        self._lock = threading.Lock()
+        # La primera carga es síncrona: hasta tenerla no hay nada que servir.
+        self._huella = huella_archivo(ruta)
+        self._publicar(self._construir(hash_archivo(ruta)))
+        self._parar = threading.Event()
+        self._hilo = threading.Thread(target=self._vigilar, name=f"recarga-{os.path.basename(ruta)}", daemon=True)
+        self._hilo.start()
+
+    def actual(self):
+        # Lectura de una sola referencia: nunca espera a una recarga en curso.
+        return self._actual
+
+    def detener(self):
+        self._parar.set(); self._hilo.join()
+
+    def _construir(self, version):
+        # El cargador recibe el hash ya calculado para que datos y derivados compartan una única versión.
+        datos = self.cargador(self.ruta, version)
+        return Version(version, datos, {nombre: construir(datos, version) for nombre, construir in self.constructores.items()})
+
+    def _publicar(self, nueva):
+        with self._lock: self._actual = nueva
+        if self.diferidos: threading.Thread(target=self._completar, args=(nueva,), name=f"diferidos-{os.path.basename(self.ruta)}", daemon=True).start()
+
+    def _completar(self, base):
+        try: extra = {nombre: construir(base.datos, base.version) for nombre, construir in self.diferidos.items()}
+        except Exception as e: self.ultimo_error = e; return
+        # Solo se completa la versión para la que se construyó; si ya hay otra más nueva, se descarta.
+        with self._lock:
+            if self._actual is base: self._actual = base._replace(derivados={**base.derivados, **extra})
+
+    def comprobar(self):
+        huella = huella_archivo(self.ruta)
+        if huella == self._huella: return False
+        version = hash_archivo(self.ruta)
+        # Un cambio de mtime sin cambio de contenido (p. ej. un touch) no invalida nada.
+        cambiado = version != self._actual.version
+        if cambiado: self._publicar(self._construir(version))
+        # Si la carga falla la huella no se actualiza y se reintenta en la siguiente vuelta.
+        self._huella, self.ultimo_error = huella, None
+        return cambiado
+
+    def _vigilar(self):
+        while not self._parar.wait(self.intervalo):
+            # Si la nueva versión no se puede cargar se sigue sirviendo la anterior.
+            try: self.comprobar()
+            except Exception as e: self.ultimo_error = e
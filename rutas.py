@@ -0,0 +1,78 @@
+# rutas.py
+# Cálculo de rutas con Google Directions (regla de tope a 90 km/h por tramo) y
+# resolución concurrente de ida y vuelta, agrupando peticiones idénticas en vuelo.
+import math
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import googlemaps
+
+import metricas
+from cache_rutas import clave_ruta
+from motor_calculo import es_trayecto_identico
+
+
+@metricas.medido('rutas.calcular_minutos_con_limite')
+def calcular_minutos_con_limite(origen, destino, gmaps_client, cache=None):
+    # La caché es un atajo: si falla la lectura se pregunta a Google y si falla la escritura se devuelve igualmente el resultado.
+    if cache is not None:
+        try: en_cache = cache.obtener(origen, destino)
+        except sqlite3.Error: en_cache = None; metricas.contar('cache_rutas.errores')
+        metricas.contar('cache_rutas.aciertos' if en_cache else 'cache_rutas.fallos')
+        if en_cache: return en_cache[0], en_cache[1], None
+    try:
+        metricas.contar('google.directions.llamadas')
+        with metricas.medir('google.directions'):
+            directions_result = gmaps_client.directions(origen, destino, mode="driving", avoid="tolls")
+        if not directions_result or not directions_result[0]['legs']:
+            return None, None, "No se pudo encontrar una ruta para las direcciones proporcionadas."
+
+        steps = directions_result[0]['legs'][0]['steps']
+        total_capped_duration_seconds, total_distance_meters = 0, 0
+        for step in steps:
+            distancia_metros = step['distance']['value']
+            duracion_google_seg = step['duration']['value']
+            total_distance_meters += distancia_metros
+            theoretical_duration_90kmh_seg = (distancia_metros / 1000) / (90 / 3600) if distancia_metros > 0 else 0
+            capped_duration_seg = max(duracion_google_seg, theoretical_duration_90kmh_seg)
+            total_capped_duration_seconds += capped_duration_seg
+        total_distancia_km = total_distance_meters / 1000
+        total_minutos_final = math.ceil(total_capped_duration_seconds / 60)
+        if cache is not None:
+            try: cache.guardar(origen, destino, total_distancia_km, total_minutos_final)
+            except sqlite3.Error: metricas.contar('cache_rutas.errores')
+        return total_distancia_km, total_minutos_final, None
+    except googlemaps.exceptions.ApiError as e: return None, None, f"Error de la API de Google: {e}"
+    except Exception as e: return None, None, f"Error inesperado: {e}"
+
+
+class ResolutorRutas:
+    def __init__(self, max_workers=8):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="rutas")
+        self._en_vuelo, self._lock = {}, threading.Lock()
+
+    # Si otra sesión ya está pidiendo la misma ruta, se devuelve su misma Future.
+    def resolver(self, origen, destino, gmaps_client, cache=None):
+        clave = clave_ruta(origen, destino)
+        with self._lock:
+            futuro = self._en_vuelo.get(clave)
+            if futuro is not None: metricas.contar('rutas.agrupadas'); return futuro
+            futuro = self._pool.submit(calcular_minutos_con_limite, origen, destino, gmaps_client, cache)
+            self._en_vuelo[clave] = futuro
+        # Fuera del lock: si la Future ya terminó, el callback se ejecuta en este mismo hilo.
+        futuro.add_done_callback(lambda f: self._liberar(clave, f))
+        return futuro
+
+    def _liberar(self, clave, futuro):
+        with self._lock:
+            if self._en_vuelo.get(clave) is futuro: del self._en_vuelo[clave]
+
+    def resolver_ida_vuelta(self, origen_ida, destino_ida, origen_vuelta, destino_vuelta, gmaps_client, cache=None):
+        ida = self.resolver(origen_ida, destino_ida, gmaps_client, cache)
+        # En un trayecto idéntico la vuelta es la ida invertida: no se pide una segunda ruta.
+        if es_trayecto_identico(origen_ida, destino_ida, origen_vuelta, destino_vuelta):
+            resultado_ida = ida.result()
+            return resultado_ida, resultado_ida
+        vuelta = self.resolver(origen_vuelta, destino_vuelta, gmaps_client, cache)
+        return ida.result(), vuelta.result()
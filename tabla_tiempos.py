@@ -0,0 +1,222 @@
+# tabla_tiempos.py
+# Lectura de tiempos.csv y compilación a un fichero binario indexado que se
+# mapea en memoria al arrancar, para no volver a parsear el CSV en cada proceso.
+#
+# Uso (paso de build):  python tabla_tiempos.py [tiempos.csv]
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+import metricas
+from recarga import hash_archivo
+
+# --- FORMATO DEL ARTEFACTO ---
+# MAGIA (8 bytes) | longitud cabecera (uint64 LE) | cabecera JSON | columnas alineadas a 8 bytes
+MAGIA = b'DIGITT02'
+ALINEACION = 8
+COLUMNAS_TEXTO = ['poblacion', 'centro_trabajo', 'provincia_ct']
+COLUMNAS_NUMERICAS = {'distancia': '<f8', 'minutos_total': '<i4', 'minutos_cargo': '<i4'}
+REQUIRED_COLS = COLUMNAS_TEXTO + list(COLUMNAS_NUMERICAS)
+# Solo las usa el buscador de lugares; si faltan en el CSV quedan vacías.
+COLUMNAS_OPCIONALES = ['provincia', 'municipio', 'cod_ine']
+
+
+class ColumnasFaltantes(ValueError):
+    pass
+
+
+def ruta_compilada(filename):
+    return os.path.splitext(filename)[0] + '.bin'
+
+
+# --- LECTURA DEL CSV ORIGINAL ---
+def leer_csv_tiempos(filename):
+    df = pd.read_csv(filename, delimiter=';', encoding='latin-1', header=0, dtype={'COD INE': str})
+
+    col_poblacion = 'Poblacion_IC'
+    col_centro_trabajo = 'Centro de Trabajo Nuevo'
+    col_provincia_ct = 'Provincia Centro de Trabajo'
+    col_distancia = 'Distancia en Kms'
+    col_minutos_total = 'Tiempo(Min)'
+    col_minutos_cargo = 'Tiempo a cargo de empresa(Min)'
+    col_provincia = 'Provincia_WFI'
+    col_municipio = 'Municipio'
+    col_cod_ine = 'COD INE'
+
+    df.rename(columns={
+        col_poblacion: 'poblacion',
+        col_centro_trabajo: 'centro_trabajo',
+        col_provincia_ct: 'provincia_ct',
+        col_distancia: 'distancia',
+        col_minutos_total: 'minutos_total',
+        col_minutos_cargo: 'minutos_cargo',
+        col_provincia: 'provincia',
+        col_municipio: 'municipio',
+        col_cod_ine: 'cod_ine'
+    }, inplace=True)
+
+    if not all(col in df.columns for col in REQUIRED_COLS):
+        raise ColumnasFaltantes(f"El archivo '{filename}' no contiene todas las columnas necesarias. Revisa que existan: {REQUIRED_COLS}.")
+
+    for col in COLUMNAS_OPCIONALES:
+        if col not in df.columns: df[col] = ''
+    df_clean = df[REQUIRED_COLS + COLUMNAS_OPCIONALES].dropna(subset=COLUMNAS_TEXTO)
+    for col in COLUMNAS_TEXTO:
+        df_clean[col] = df_clean[col].str.strip()
+    for col in COLUMNAS_OPCIONALES:
+        df_clean[col] = df_clean[col].fillna('').astype(str).str.strip()
+    # Los códigos INE pierden el cero inicial si el CSV pasó por una hoja de cálculo.
+    df_clean['cod_ine'] = df_clean['cod_ine'].where(~df_clean['cod_ine'].str.isdigit(), df_clean['cod_ine'].str.zfill(5))
+
+    for col in COLUMNAS_NUMERICAS:
+        df_clean[col] = df_clean[col].astype(str).str.replace(',', '.', regex=False)
+        df_clean[col] = pd.to_numeric(df_clean[col], errors='coerce').fillna(0)
+
+    df_clean['minutos_total'] = df_clean['minutos_total'].astype(int)
+    df_clean['minutos_cargo'] = df_clean['minutos_cargo'].astype(int)
+
+    return df_clean
+
+
+# --- COMPILACIÓN ---
+def compilar_tabla(filename, destino=None, df=None, sha=None):
+    # Con df y sha ya calculados (desde cargar_tiempos) no se vuelve a leer ni a hashear el CSV.
+    destino = destino or ruta_compilada(filename)
+    if sha is None: sha = hash_archivo(filename)
+    if df is None: df = leer_csv_tiempos(filename)
+
+    cadenas, bloques = {}, []
+    for col in COLUMNAS_TEXTO + COLUMNAS_OPCIONALES:
+        codigos, valores = pd.factorize(df[col], sort=True)
+        cadenas[col] = [str(v) for v in valores]
+        bloques.append((col, codigos.astype('<i4')))
+    for col, dtype in COLUMNAS_NUMERICAS.items():
+        bloques.append((col, df[col].to_numpy().astype(dtype)))
+
+    # La cabecera se serializa dos veces: la primera para conocer su tamaño y fijar los offsets.
+    def _cabecera(offsets):
+        return json.dumps({
+            'sha256': sha, 'filas': len(df), 'cadenas': cadenas,
+            'columnas': {col: {'dtype': arr.dtype.str, 'offset': offsets.get(col, 0)} for col, arr in bloques},
+        }, ensure_ascii=False).encode('utf-8')
+
+    def _alinear(n):
+        return -(-n // ALINEACION) * ALINEACION
+
+    offsets = {col: 0xFFFFFFFFFFFF for col, _ in bloques}
+    inicio = _alinear(len(MAGIA) + 8 + len(_cabecera(offsets)))
+    posicion = inicio
+    for col, arr in bloques:
+        offsets[col] = posicion
+        posicion = _alinear(posicion + arr.nbytes)
+    cabecera = _cabecera(offsets)
+    cabecera += b' ' * (inicio - len(MAGIA) - 8 - len(cabecera))
+
+    # Escritura atómica: los procesos que ya tengan el fichero mapeado siguen viendo la versión anterior.
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(destino)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(MAGIA + struct.pack('<Q', len(cabecera)) + cabecera)
+            for col, arr in bloques:
+                f.seek(offsets[col]); f.write(arr.tobytes())
+        os.replace(tmp, destino)
+    except BaseException:
+        if os.path.exists(tmp): os.remove(tmp)
+        raise
+    return destino
+
+
+# --- CARGA ---
+def cargar_tabla_compilada(filename, sha=None):
+    """Devuelve el DataFrame desde el artefacto mapeado, o None si no existe o está obsoleto."""
+    ruta = ruta_compilada(filename)
+    if not os.path.exists(ruta): return None
+    # Un artefacto vacío, truncado o corrupto se trata como obsoleto: se vuelve al CSV y se recompila.
+    try: return _leer_artefacto(ruta, sha or hash_archivo(filename))
+    except (ValueError, KeyError, IndexError, TypeError, struct.error, OSError): return None
+
+
+def _leer_artefacto(ruta, sha):
+    with open(ruta, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if mm[:len(MAGIA)] != MAGIA: return None
+    (longitud,) = struct.unpack_from('<Q', mm, len(MAGIA))
+    cabecera = json.loads(bytes(mm[len(MAGIA) + 8:len(MAGIA) + 8 + longitud]))
+    if cabecera['sha256'] != sha: return None
+
+    n = cabecera['filas']
+    metas = {col: (np.dtype(meta['dtype']), meta['offset']) for col, meta in cabecera['columnas'].items()}
+    if any(offset + n * dtype.itemsize > len(mm) for dtype, offset in metas.values()): return None
+    columnas = {col: np.frombuffer(mm, dtype=dtype, count=n, offset=offset) for col, (dtype, offset) in metas.items()}
+    datos = {}
+    for col in REQUIRED_COLS + COLUMNAS_OPCIONALES:
+        if col in cabecera['cadenas']:
+            datos[col] = np.asarray(cabecera['cadenas'][col], dtype=object)[columnas[col]]
+        else:
+            datos[col] = columnas[col]
+    df = pd.DataFrame(datos)
+    df['minutos_total'] = df['minutos_total'].astype(int)
+    df['minutos_cargo'] = df['minutos_cargo'].astype(int)
+    df.attrs['version'] = cabecera['sha256']
+    return df
+
+
+@metricas.medido('carga.tiempos')
+def cargar_tiempos(filename, sha=None):
+    # DatosVivos pasa el hash que ya ha calculado: una sola pasada y una sola versión por carga.
+    if sha is None: sha = hash_archivo(filename)
+    df = cargar_tabla_compilada(filename, sha)
+    metricas.contar('tabla_tiempos.compilada' if df is not None else 'tabla_tiempos.csv')
+    if df is not None: return df
+    # Artefacto ausente u obsoleto: se parsea el CSV y se intenta regenerar para el próximo arranque.
+    df = leer_csv_tiempos(filename)
+    df.attrs['version'] = sha
+    try: compilar_tabla(filename, df=df, sha=sha)
+    except OSError: pass
+    return df
+
+
+# --- ÍNDICE DE CONSULTA ---
+# Se construye una vez por versión de datos; cada interacción en la pestaña oficial es O(1).
+@dataclass(frozen=True, slots=True)
+class RegistroTiempo:
+    distancia: float
+    minutos_total: int
+    minutos_cargo: int
+    centro_trabajo: str
+
+
+class IndiceTiempos:
+    __slots__ = ('version', 'provincias', 'centros', '_poblaciones', '_registros')
+
+    def __init__(self, df, version=None):
+        self.version = version
+        self.centros, self._registros, poblaciones = {}, {}, {}
+        filas = zip(df['provincia_ct'].tolist(), df['poblacion'].tolist(), df['centro_trabajo'].tolist(),
+                    df['distancia'].tolist(), df['minutos_total'].tolist(), df['minutos_cargo'].tolist())
+        for provincia, poblacion, centro, distancia, minutos_total, minutos_cargo in filas:
+            # Como en el filtrado original (.iloc[0]), manda la primera fila de cada combinación.
+            self.centros.setdefault(provincia, centro)
+            poblaciones.setdefault(provincia, set()).add(poblacion)
+            if (provincia, poblacion) not in self._registros:
+                self._registros[(provincia, poblacion)] = RegistroTiempo(float(distancia), int(minutos_total), int(minutos_cargo), centro)
+        self.provincias = sorted(poblaciones)
+        self._poblaciones = {provincia: sorted(nombres) for provincia, nombres in poblaciones.items()}
+
+    def poblaciones_de(self, provincia):
+        return self._poblaciones.get(provincia, [])
+
+    def buscar(self, provincia, poblacion):
+        return self._registros.get((provincia, poblacion))
+
+
+if __name__ == '__main__':
+    origen = sys.argv[1] if len(sys.argv) > 1 else 'tiempos.csv'
+    print(f"Compilado '{origen}' -> '{compilar_tabla(origen)}'")
@@ -0,0 +1,115 @@
+# tests/test_correo.py
+# Cola de correo contra un servidor SMTP local (aiosmtpd): entrega, lotes de destinatarios,
+# reintentos hasta 'fallido', rechazos 5xx sin reintentos y supervivencia del trabajador a
+# errores de la bandeja.
+import os
+import socket
+import sqlite3
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import correo  # noqa: E402
+
+controller = pytest.importorskip('aiosmtpd.controller')
+
+
+class Servidor:
+    def __init__(self, respuesta='250 OK'):
+        self.respuesta, self.sobres = respuesta, []
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.respuesta.startswith('250'): self.sobres.append(envelope)
+        return self.respuesta
+
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def smtp():
+    def arrancar(respuesta='250 OK'):
+        servidor = Servidor(respuesta)
+        control = controller.Controller(servidor, hostname='127.0.0.1', port=puerto_libre())
+        control.start()
+        arrancados.append(control)
+        return servidor, {'server': '127.0.0.1', 'port': control.port, 'username': 'avisos@digi.es', 'starttls': False}
+    arrancados = []
+    yield arrancar
+    for control in arrancados: control.stop()
+
+
+@pytest.fixture
+def colas():
+    creadas = []
+    yield creadas
+    for cola in creadas: cola.detener()
+
+
+def esperar(condicion, limite=10.0):
+    fin = time.monotonic() + limite
+    while time.monotonic() < fin:
+        if condicion(): return True
+        time.sleep(0.02)
+    return False
+
+
+def test_entrega_en_lotes(smtp, colas, tmp_path):
+    servidor, config = smtp()
+    cola = correo.ColaCorreo(config, str(tmp_path / 'bandeja.sqlite'), max_destinatarios=2, intervalo_sondeo=0.05)
+    colas.append(cola)
+    destinatarios = [f"persona{i}@digi.es" for i in range(5)]
+    ids = cola.encolar(destinatarios, "Asunto", "Cuerpo")
+    assert len(ids) == 3
+    assert esperar(lambda: all(e['estado'] == correo.ENVIADO for e in cola.estado(ids)))
+    assert [len(sobre.rcpt_tos) for sobre in servidor.sobres] == [2, 2, 1]
+    assert sorted(r for sobre in servidor.sobres for r in sobre.rcpt_tos) == destinatarios
+
+
+def test_reintentos_hasta_fallido(smtp, colas, tmp_path):
+    _, config = smtp('451 4.3.0 Inténtalo más tarde')
+    cola = correo.ColaCorreo(config, str(tmp_path / 'bandeja.sqlite'), max_intentos=3, espera_base=0.01, intervalo_sondeo=0.05)
+    colas.append(cola)
+    ids = cola.encolar(["persona@digi.es"], "Asunto", "Cuerpo")
+    assert esperar(lambda: cola.estado(ids)[0]['estado'] == correo.FALLIDO)
+    estado = cola.estado(ids)[0]
+    assert estado['intentos'] == 3
+    assert '451' in estado['ultimo_error']
+
+
+def test_rechazo_permanente_sin_reintentos(smtp, colas, tmp_path):
+    _, config = smtp('550 5.1.1 Buzón inexistente')
+    cola = correo.ColaCorreo(config, str(tmp_path / 'bandeja.sqlite'), max_intentos=5, espera_base=0.01, intervalo_sondeo=0.05)
+    colas.append(cola)
+    ids = cola.encolar(["nadie@digi.es"], "Asunto", "Cuerpo")
+    assert esperar(lambda: cola.estado(ids)[0]['estado'] == correo.FALLIDO)
+    estado = cola.estado(ids)[0]
+    assert estado['intentos'] == 1
+    assert '550' in estado['ultimo_error']
+
+
+def test_el_trabajador_sobrevive_a_errores_de_la_bandeja(smtp, colas, tmp_path):
+    servidor, config = smtp()
+
+    class ColaBloqueada(correo.ColaCorreo):
+        fallos = 1
+
+        def _reclamar(self, con):
+            if self.fallos:
+                self.fallos -= 1
+                raise sqlite3.OperationalError('database is locked')
+            return super()._reclamar(con)
+
+    cola = ColaBloqueada(config, str(tmp_path / 'bandeja.sqlite'), intervalo_sondeo=0.05)
+    colas.append(cola)
+    ids = cola.encolar(["persona@digi.es"], "Asunto", "Cuerpo")
+    assert esperar(lambda: cola.estado(ids)[0]['estado'] == correo.ENVIADO)
+    assert cola._hilo.is_alive()
+    assert cola.ultimo_error is None
+    assert len(servidor.sobres) == 1
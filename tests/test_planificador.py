@@ -0,0 +1,46 @@
+# tests/test_planificador.py
+# Lectura de las asignaciones subidas (exportaciones de Excel en UTF-8 y en cp1252) y búsqueda
+# de las poblaciones sin tildes ni mayúsculas.
+import io
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import planificador  # noqa: E402
+import tabla_tiempos  # noqa: E402
+
+CSV = "Fecha;Entrada;Salida;Provincia\r\n05/10/2026;A Pobra do Brollón;Monforte de Lemos;Lugo\r\n"
+
+
+@pytest.mark.parametrize('codificacion', ['utf-8-sig', 'utf-8', 'cp1252'])
+def test_leer_asignaciones_en_utf8_y_cp1252(codificacion):
+    df = planificador.leer_asignaciones(io.BytesIO(CSV.encode(codificacion)))
+    assert list(df.columns) == ['fecha', 'entrada', 'salida', 'provincia']
+    assert df.loc[0, 'entrada'] == "A Pobra do Brollón"
+    assert df.loc[0, 'salida'] == "Monforte de Lemos"
+
+
+@pytest.fixture
+def indice():
+    return tabla_tiempos.IndiceTiempos(pd.DataFrame({
+        'provincia_ct': ['Lugo', 'Lugo', 'Lugo'], 'poblacion': ['A Pastoriza', 'A Pobra do Brollón', 'Lugo'],
+        'centro_trabajo': ['Lugo'] * 3, 'distancia': [30.0, 60.0, 1.0], 'minutos_total': [35, 55, 5], 'minutos_cargo': [5, 25, 0]}))
+
+
+def test_poblaciones_sin_tildes_ni_mayusculas(indice):
+    asignaciones = pd.DataFrame({'fecha': ['05/10/2026', '06/10/2026'], 'entrada': ['a pastoriza', 'A PASTORIZA'],
+                                 'salida': ['a pobra do brollon', 'LUGO'], 'provincia': ['lugo', '']})
+    plan = planificador.planificar(asignaciones, indice, 'Lugo')
+    assert plan['error'].tolist() == ['', '']
+    assert plan['distancia_ida'].tolist() == [30.0, 30.0]
+    assert plan['distancia_vuelta'].tolist() == [60.0, 1.0]
+
+
+def test_se_informan_las_dos_poblaciones_no_encontradas(indice):
+    asignaciones = pd.DataFrame({'fecha': ['05/10/2026'], 'entrada': ['Ourense'], 'salida': ['Vigo']})
+    plan = planificador.planificar(asignaciones, indice, 'Lugo')
+    assert plan.loc[0, 'error'] == "Población de entrada no encontrada en la tabla; Población de salida no encontrada en la tabla"